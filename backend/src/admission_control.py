@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import deque
+
+
+# ===========================
+# 1. Errors
+# ===========================
+class RequestShed(Exception):
+    """Raised when a request is rejected instead of queued: queue full or deadline unreachable."""
+    def __init__(self, reason, priority):
+        super().__init__(f"request shed ({reason}) for priority '{priority}'")
+        self.reason = reason
+        self.priority = priority
+
+
+# ===========================
+# 2. Admission Controller
+# ===========================
+class _Waiter:
+    def __init__(self, priority):
+        self.priority = priority
+        self.granted = False
+
+class AdmissionController:
+    """
+    Bounded, priority-ordered admission in front of the RAG pipeline.
+
+    - Each priority class has its own bounded FIFO queue; higher classes are
+      always granted first when a slot frees up.
+    - A request is shed up front, or while queued, once its deadline can no
+      longer cover the expected LLM time (EWMA of observed LLM latency).
+    - The concurrency limit adapts to LLM latency: additive increase while
+      latency stays under target, multiplicative decrease when it exceeds it
+      or a call fails.
+    - The EWMA starts at the target, single samples are capped at
+      `max_latency_sample`, and without new samples the EWMA decays back
+      toward the target (`decay_half_life` seconds). Shedding everything
+      therefore cannot freeze the estimate: requests are admitted again
+      once it has decayed.
+    """
+    def __init__(self, priorities, queue_sizes, initial_limit=4, min_limit=1, max_limit=16,
+                 target_latency=4.0, decrease_factor=0.9, ewma_alpha=0.2,
+                 max_latency_sample=None, decay_half_life=30.0, clock=time.monotonic):
+        self.priorities = list(priorities)
+        self.queue_sizes = {p: int(queue_sizes.get(p, 16)) for p in self.priorities}
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+        self.ewma_alpha = ewma_alpha
+        self.max_latency_sample = max_latency_sample if max_latency_sample is not None else 3 * target_latency
+        self.decay_half_life = decay_half_life
+        self.clock = clock
+
+        self._limit = float(initial_limit)
+        self._latency_ewma = float(target_latency)
+        self._ewma_updated_at = self.clock()
+        self._in_flight = 0
+        self._queues = {p: deque() for p in self.priorities}
+        self._cond = threading.Condition()
+        self._admitted = {p: 0 for p in self.priorities}
+        self._shed = {p: {} for p in self.priorities}
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    def _current_latency(self, now=None):
+        """EWMA decayed toward the target by the time since the last sample."""
+        if self._latency_ewma <= self.target_latency or self.decay_half_life <= 0:
+            return self._latency_ewma
+        if now is None:
+            now = self.clock()
+        decay = 0.5 ** ((now - self._ewma_updated_at) / self.decay_half_life)
+        return self.target_latency + (self._latency_ewma - self.target_latency) * decay
+
+    def expected_llm_seconds(self, llm_calls):
+        """Expected time for `llm_calls` sequential LLM calls."""
+        return self._current_latency() * llm_calls
+
+    # ----- admission -----
+
+    def _record_shed(self, priority, reason):
+        """Caller holds the lock."""
+        self._shed[priority][reason] = self._shed[priority].get(reason, 0) + 1
+        return RequestShed(reason, priority)
+
+    def _next_waiter(self):
+        """Head of the highest non-empty priority queue. Caller holds the lock."""
+        for p in self.priorities:
+            if self._queues[p]:
+                return self._queues[p][0]
+        return None
+
+    def _grant_waiting(self):
+        """Hands free slots to queued requests in priority order. Caller holds the lock."""
+        granted_any = False
+        while self._in_flight < self.limit:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            self._queues[waiter.priority].popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            self._admitted[waiter.priority] += 1
+            granted_any = True
+        if granted_any:
+            self._cond.notify_all()
+
+    def acquire(self, priority, deadline, llm_calls=1):
+        """
+        Blocks until the request may run. `deadline` is a timestamp on this controller's clock.
+        Raises RequestShed if the queue is full or the deadline cannot be met.
+        """
+        if priority not in self._queues:
+            priority = self.priorities[-1]
+
+        with self._cond:
+            if deadline - self.clock() < self.expected_llm_seconds(llm_calls):
+                raise self._record_shed(priority, "deadline")
+
+            if self._in_flight < self.limit and self._next_waiter() is None:
+                self._in_flight += 1
+                self._admitted[priority] += 1
+                return
+
+            if len(self._queues[priority]) >= self.queue_sizes[priority]:
+                raise self._record_shed(priority, "queue_full")
+
+            waiter = _Waiter(priority)
+            self._queues[priority].append(waiter)
+            try:
+                while not waiter.granted:
+                    # Give up while there is still time to answer with a degraded response
+                    remaining = deadline - self.clock() - self.expected_llm_seconds(llm_calls)
+                    if remaining <= 0:
+                        raise self._record_shed(priority, "deadline")
+                    self._cond.wait(timeout=remaining)
+            except BaseException:
+                # Never leave a dead waiter queued or a granted slot unreleased
+                if waiter.granted:
+                    self._in_flight -= 1
+                    self._grant_waiting()
+                else:
+                    self._queues[priority].remove(waiter)
+                raise
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._grant_waiting()
+
+    # ----- adaptation -----
+
+    def observe_llm_latency(self, seconds, failed=False):
+        """
+        Feeds one LLM call into the EWMA and the concurrency limit. A failed call
+        (timeout, API error) counts as at least the target latency and always
+        shrinks the limit.
+        """
+        if failed:
+            seconds = max(seconds, self.target_latency)
+        seconds = min(max(seconds, 0.0), self.max_latency_sample)
+
+        with self._cond:
+            now = self.clock()
+            current = self._current_latency(now)
+            self._latency_ewma = current + self.ewma_alpha * (seconds - current)
+            self._ewma_updated_at = now
+
+            if failed or self._latency_ewma > self.target_latency:
+                self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+            else:
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+                self._grant_waiting()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency_limit": self.limit,
+                "in_flight": self._in_flight,
+                "llm_latency_ewma": self._current_latency(),
+                "queue_depth": {p: len(q) for p, q in self._queues.items()},
+                "admitted": dict(self._admitted),
+                "shed": {p: dict(r) for p, r in self._shed.items()},
+            }
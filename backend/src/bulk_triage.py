@@ -0,0 +1,309 @@
+"""
+Offline bulk triage of historical patient complaints.
+
+Streams a CSV or JSONL file through the same pipeline as the API
+(extract_symptoms_via_llm -> retrieve_relevant_context -> generate_answer).
+Encode + FAISS search run batched in a process pool; LLM calls run in a
+rate-limited thread pool in the parent. Results are appended to a JSONL file
+and progress is checkpointed after every batch, so an interrupted run picks
+up where it stopped when started again with the same arguments (a resume
+with a different input file or arguments is refused).
+
+Usage (from backend/src):
+    python bulk_triage.py complaints.csv results.jsonl --llm none
+    python bulk_triage.py complaints.jsonl results.jsonl --llm extract --llm-rps 5
+    python bulk_triage.py complaints.csv results.jsonl --llm full --workers 4
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import rag_openai as rag
+from config_loader import config
+
+
+# ===========================
+# 1. Input Streaming
+# ===========================
+def stream_rows(path, text_column, id_column=None):
+    """Yields (row_id, text) without loading the whole file."""
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = (json.loads(line) for line in f if line.strip()) if path.suffix == ".jsonl" else csv.DictReader(f)
+        for line_no, row in enumerate(rows):
+            row_id = row.get(id_column) if id_column else line_no
+            yield row_id, (row.get(text_column) or "").strip()
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ===========================
+# 2. Checkpointing
+# ===========================
+def run_settings(args):
+    """What a resumed run must share with the original: the exact input file and the result-shaping args."""
+    stat = os.stat(args.input)
+    return {
+        "input": str(Path(args.input).resolve()),
+        "input_size": stat.st_size,
+        "input_mtime_ns": stat.st_mtime_ns,
+        "text_column": args.text_column,
+        "id_column": args.id_column,
+        "llm": args.llm,
+        "k": args.k,
+        "tenant": args.tenant,
+    }
+
+class Checkpoint:
+    """
+    Progress file next to the output: rows completed, the output size at that
+    point and the run settings. On resume, output past the recorded size (a
+    batch written but not checkpointed) is truncated, so no row is duplicated
+    or lost. Resuming with different settings is refused, so one output file
+    never mixes rows computed under different inputs or modes; so is resuming
+    when the output is missing or shorter than the checkpoint says.
+    """
+    def __init__(self, output_path, settings):
+        self.path = Path(str(output_path) + ".ckpt")
+        self.settings = settings
+        self.rows_done = 0
+        self.output_bytes = 0
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("settings") != settings:
+                changed = sorted(k for k in settings if (state.get("settings") or {}).get(k) != settings[k])
+                raise ValueError(
+                    f"Checkpoint {self.path} was written with different settings ({', '.join(changed)}). "
+                    f"Use a new output file, or delete the checkpoint and output to start over."
+                )
+            self.rows_done = state["rows_done"]
+            self.output_bytes = state["output_bytes"]
+            if self.rows_done:
+                output_size = os.path.getsize(output_path) if os.path.exists(output_path) else None
+                if output_size is None or output_size < self.output_bytes:
+                    found = "the file is missing" if output_size is None else f"it has {output_size}"
+                    raise ValueError(
+                        f"Checkpoint {self.path} expects {self.output_bytes} bytes of output in {output_path}, "
+                        f"but {found}. Delete the checkpoint and output to start over."
+                    )
+
+    def save(self, rows_done, output_bytes):
+        self.rows_done, self.output_bytes = rows_done, output_bytes
+        tmp_path = self.path.with_suffix(".ckpt.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"rows_done": rows_done, "output_bytes": output_bytes,
+                       "settings": self.settings, "updated_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+
+
+# ===========================
+# 3. LLM Rate Limiting
+# ===========================
+class RateLimiter:
+    """Token bucket shared by the LLM threads; rps <= 0 disables limiting."""
+    def __init__(self, rps, burst=1):
+        self.rps = rps
+        self.capacity = max(burst, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rps <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rps)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rps
+            time.sleep(wait)
+
+
+# ===========================
+# 4. Process Pool Workers
+# ===========================
+_worker_bundle = None
+
+def _init_worker(threads, tenant_id):
+    """Loads the model (and tenant bundle) once per worker process."""
+    global _worker_bundle
+    import torch
+    torch.set_num_threads(threads)
+    rag.load_resources()
+    from tenant_registry import load_bundle, load_default_bundle
+    if tenant_id and tenant_id != config.default_tenant:
+        _worker_bundle = load_bundle(tenant_id)
+    else:
+        _worker_bundle = load_default_bundle(rag.index, rag.metadata)
+
+def _search_batch(queries, k):
+    return rag.retrieve_relevant_contexts(queries, k=k, bundle=_worker_bundle)
+
+
+# ===========================
+# 5. Pipeline
+# ===========================
+def run(args):
+    checkpoint = Checkpoint(args.output, run_settings(args))
+    if checkpoint.rows_done:
+        print(f"↩️ Resuming after {checkpoint.rows_done} rows")
+
+    limiter = RateLimiter(args.llm_rps, burst=args.llm_concurrency)
+
+    def call_llm(fn, *fn_args):
+        limiter.acquire()
+        return fn(*fn_args)
+
+    def extract(texts):
+        if args.llm == "none":
+            # Raw text as the query, like the API's degraded path
+            return [sorted(rag.extract_symptoms_from_text(t)) for t in texts], [None if t else "empty input" for t in texts]
+        futures = [llm_pool.submit(call_llm, rag.extract_symptoms_via_llm, t) if t else None for t in texts]
+        symptoms, errors = [], []
+        for future in futures:
+            if future is None:
+                symptoms.append([])
+                errors.append("empty input")
+                continue
+            try:
+                symptoms.append(future.result())
+                errors.append(None)
+            except Exception as e:
+                symptoms.append([])
+                errors.append(f"extraction failed: {e}")
+        return symptoms, errors
+
+    def finish(batch, symptoms, errors, searched, docs_future, out):
+        """Completion stage (optional) + output for one batch, in input order."""
+        # Rows with an error were never searched: no department, no docs
+        docs_lists = [[] for _ in batch]
+        if docs_future is not None:
+            for i, docs in zip(searched, docs_future.result()):
+                docs_lists[i] = docs
+        answers = [None] * len(batch)
+        if args.llm == "full":
+            futures = {
+                i: llm_pool.submit(call_llm, rag.generate_answer, symptoms[i], docs_lists[i])
+                for i in range(len(batch)) if errors[i] is None and batch[i][1]
+            }
+            for i, future in futures.items():
+                try:
+                    answers[i] = future.result()
+                except Exception as e:
+                    errors[i] = f"completion failed: {e}"
+
+        for i, (row_id, text) in enumerate(batch):
+            docs = docs_lists[i]
+            record = {
+                "id": row_id,
+                "input": text,
+                "normalized_symptoms": symptoms[i],
+                "department": docs[0]["Department"] if docs else None,
+                "should_skip_questions": rag.is_high_confidence(docs),
+                "retrieved_docs": [
+                    {"Disease": d["Disease"], "Department": d["Department"], "final_score": d["final_score"]}
+                    for d in docs
+                ],
+                "answer": answers[i],
+                "error": errors[i],
+            }
+            out.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    # Checkpoint guarantees the output holds at least output_bytes when resuming
+    with open(args.output, "r+b" if checkpoint.rows_done else "wb") as out:
+        # Drop anything written after the last checkpoint
+        out.truncate(checkpoint.output_bytes)
+        out.seek(0, os.SEEK_END)
+
+        rows = itertools.islice(stream_rows(args.input, args.text_column, args.id_column), checkpoint.rows_done, None)
+        rows_done = checkpoint.rows_done
+        started = time.monotonic()
+        last_report = started
+        processed = 0
+
+        ctx = get_context("spawn")  # the parent holds LLM threads; never fork it
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(args.threads_per_worker, args.tenant)) as search_pool, \
+                ThreadPoolExecutor(max_workers=args.llm_concurrency) as llm_pool:
+            in_flight = deque()
+
+            def drain_one():
+                nonlocal rows_done, processed, last_report
+                batch, symptoms, errors, searched, docs_future = in_flight.popleft()
+                finish(batch, symptoms, errors, searched, docs_future, out)
+                out.flush()
+                os.fsync(out.fileno())
+                rows_done += len(batch)
+                processed += len(batch)
+                checkpoint.save(rows_done, out.tell())
+
+                now = time.monotonic()
+                if now - last_report >= args.report_every:
+                    print(f"⏱️ {rows_done} rows done, {processed / (now - started):.1f} rows/s")
+                    last_report = now
+
+            for batch in batched(rows, args.batch_size):
+                symptoms, errors = extract([text for _, text in batch])
+                searched = [i for i, error in enumerate(errors) if error is None]
+                queries = [batch[i][1] if args.llm == "none" else ", ".join(symptoms[i]) for i in searched]
+                docs_future = search_pool.submit(_search_batch, queries, args.k) if queries else None
+                in_flight.append((batch, symptoms, errors, searched, docs_future))
+                # Bounded window: keeps memory flat and overlaps LLM work with searches
+                if len(in_flight) >= args.workers * 2:
+                    drain_one()
+
+            while in_flight:
+                drain_one()
+
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        print(f"✅ {processed} rows in {elapsed:.1f}s ({rate:.1f} rows/s), {rows_done} total -> {args.output}")
+
+
+# ===========================
+# 6. CLI
+# ===========================
+def main():
+    parser = argparse.ArgumentParser(description="Run historical complaints through the triage pipeline in bulk.")
+    parser.add_argument("input", help="CSV or JSONL file of patient complaints")
+    parser.add_argument("output", help="JSONL results file; progress is tracked in <output>.ckpt")
+    parser.add_argument("--text-column", default="symptoms")
+    parser.add_argument("--id-column", help="Column to copy into each result as 'id' (default: row number)")
+    parser.add_argument("--llm", choices=["none", "extract", "full"], default="extract",
+                        help="none: retrieval on raw text; extract: LLM symptom extraction; full: also the completion")
+    parser.add_argument("--llm-rps", type=float, default=0, help="Max LLM requests per second (0 = unlimited)")
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=config.retrieval_k)
+    parser.add_argument("--tenant", default=config.default_tenant)
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between throughput reports")
+    args = parser.parse_args()
+
+    if not Path(args.input).exists():
+        raise FileNotFoundError(f"Input file not found at {args.input}")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -95,8 +95,94 @@ class ProjectConfig:
     def temperature(self):
         return self.cfg['parameters']['temperature']
 
+    @property
+    def confidence_threshold(self):
+        return self.cfg['parameters'].get('confidence_threshold', 0.7)
+
+    @property
+    def coalesce_linger_seconds(self):
+        return self.cfg['parameters'].get('coalesce_linger_seconds', 0.0)
+
+    @property
+    def server(self):
+        defaults = {
+            'host': '127.0.0.1',
+            'port': 5000,
+            'workers': 0,
+            'threads_per_worker': 2,
+            'http_threads': 8,
+            'max_restarts': 5,
+            'restart_backoff_max_seconds': 30,
+            'restart_min_uptime_seconds': 30,
+        }
+        return {**defaults, **self.cfg.get('server', {})}
+
+    @property
+    def warmup_batch_sizes(self):
+        return self.cfg.get('warmup', {}).get('batch_sizes', [1, 8, 32])
+
+    @property
+    def admission(self):
+        defaults = {
+            'priorities': ['intake', 'doctor'],
+            'queue_sizes': {'intake': 32, 'doctor': 16},
+            'initial_concurrency': 4,
+            'min_concurrency': 1,
+            'max_concurrency': 16,
+            'target_llm_latency_seconds': 4.0,
+            'max_latency_sample_seconds': 12.0,
+            'latency_decay_half_life_seconds': 30.0,
+            'default_deadline_seconds': 30,
+            'max_deadline_seconds': 120,
+            'degrade_on_shed': True,
+        }
+        return {**defaults, **self.cfg.get('admission', {})}
+
+    @property
+    def tracing(self):
+        defaults = {'enabled': True, 'buffer_size': 256, 'profile_max_seconds': 60}
+        return {**defaults, **self.cfg.get('tracing', {})}
+
+    @property
+    def triage_log(self):
+        defaults = {
+            'enabled': True,
+            'path': 'data/triage_log.sqlite3',
+            'batch_size': 100,
+            'flush_interval_seconds': 1.0,
+            'queue_size': 10000,
+        }
+        return {**defaults, **self.cfg.get('triage_log', {})}
+
     # ===========================
-    # 4. Data Loaders
+    # 4. Tenant Getters (From YAML)
+    # ===========================
+
+    @property
+    def default_tenant(self):
+        return self.cfg.get('tenants', {}).get('default_tenant', 'default')
+
+    @property
+    def tenant_memory_budget_mb(self):
+        return self.cfg.get('tenants', {}).get('memory_budget_mb', 1024)
+
+    @property
+    def tenant_ids(self):
+        return list(self.cfg.get('tenants', {}).get('sites', {}).keys())
+
+    def tenant_paths(self, tenant_id):
+        """Returns absolute (faiss_index, metadata) paths for a tenant site."""
+        sites = self.cfg.get('tenants', {}).get('sites', {})
+        if tenant_id not in sites:
+            if tenant_id == self.default_tenant:
+                return self.faiss_index_path, self.metadata_path
+            raise KeyError(f"Unknown tenant: {tenant_id}")
+
+        site = sites[tenant_id]
+        return str(self.backend_root / site['faiss_index']), str(self.backend_root / site['metadata'])
+
+    # ===========================
+    # 5. Data Loaders
     # ===========================
 
     def load_symptom_mappings(self):
@@ -121,6 +207,10 @@ class ProjectConfig:
             raise ValueError("OPENAI_API_TOKEN not found in .env file.")
         return key
 
+    def get_admin_token(self):
+        """Optional token guarding /api/admin endpoints; None leaves them open (local use)."""
+        return os.getenv("ADMIN_TOKEN")
+
 # ===========================
 # Singleton Instance
 # ===========================
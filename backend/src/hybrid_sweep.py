@@ -0,0 +1,258 @@
+"""
+Offline tuning tool for the hybrid retrieval parameters.
+
+Encodes a labeled query set once, caches the query x document similarity and
+overlap matrices, then evaluates a whole grid of semantic/overlap weights,
+retrieval_k values and confidence thresholds as array operations.
+
+Usage (from backend/src):
+    python hybrid_sweep.py --queries labeled_queries.csv
+    python hybrid_sweep.py --from-dataset 500 --output sweep.csv
+
+--from-dataset queries are drawn from the indexed records themselves, which
+biases results toward overlap; tune on a held-out labeled set.
+
+The labeled query file (CSV or JSONL) needs a 'symptoms' column with a
+comma-separated symptom list and a 'disease' column with the expected disease.
+"""
+import argparse
+import csv
+import json
+import random
+import time
+from pathlib import Path
+
+import numpy as np
+
+import rag_openai as rag
+from config_loader import config
+
+
+# ===========================
+# 1. Labeled Query Set
+# ===========================
+def load_labeled_queries(path):
+    """Reads (symptoms, disease) pairs from a CSV or JSONL file."""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Labeled query file not found at {path}")
+
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == ".jsonl":
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    queries = []
+    for row in rows:
+        symptoms = (row.get("symptoms") or "").strip()
+        disease = (row.get("disease") or row.get("Disease") or "").strip()
+        if symptoms and disease:
+            queries.append({"symptoms": symptoms, "disease": disease})
+    return queries
+
+def sample_queries_from_metadata(n, keep_ratio=0.6, seed=42):
+    """
+    Builds a synthetic labeled set from the index metadata by keeping a random
+    subset of each record's symptoms, which mimics a patient's partial complaint.
+    The source record stays in the index and always has overlap 1.0, so this set
+    favours high overlap weights; use a held-out --queries file for tuning.
+    """
+    rng = random.Random(seed)
+    texts = rag.metadata["texts"]
+    diseases = rag.metadata["diseases"]
+
+    queries = []
+    for i in rng.sample(range(len(texts)), min(n, len(texts))):
+        symptoms = sorted(rag.extract_symptoms_from_text(texts[i]))
+        keep = max(1, round(len(symptoms) * keep_ratio))
+        subset = rng.sample(symptoms, keep)
+        queries.append({"symptoms": ", ".join(subset), "disease": str(diseases[i])})
+    return queries
+
+
+# ===========================
+# 2. Cached Score Matrices
+# ===========================
+def build_score_matrices(query_texts, max_k):
+    """
+    Returns (candidates, similarity, overlap), each of shape (queries, max_k).
+    Candidates are the FAISS top-max_k document ids ordered by L2 distance,
+    exactly as retrieve_relevant_context sees them before re-ranking.
+    """
+    query_emb = rag.embedding_model.encode(query_texts, convert_to_numpy=True, batch_size=32)
+    distances, candidates = rag.index.search(query_emb, max_k)
+    similarity = 1 / (1 + distances)
+
+    # Token overlap as a sparse incidence product: |Q ∩ D| / max(|Q|, 1)
+    doc_symptoms = [rag.extract_symptoms_from_text(t) for t in rag.metadata["texts"]]
+    query_symptoms = [rag.extract_symptoms_from_text(q) for q in query_texts]
+    vocab = {s: j for j, s in enumerate(set().union(*doc_symptoms, *query_symptoms))}
+
+    def incidence(symptom_sets):
+        matrix = np.zeros((len(symptom_sets), len(vocab)), dtype=np.float32)
+        for row, symptoms in enumerate(symptom_sets):
+            matrix[row, [vocab[s] for s in symptoms]] = 1.0
+        return matrix
+
+    q_matrix = incidence(query_symptoms)
+    d_matrix = incidence(doc_symptoms)
+    q_sizes = np.maximum(q_matrix.sum(axis=1), 1.0)
+
+    overlap = np.empty(candidates.shape, dtype=np.float32)
+    for row in range(len(query_texts)):
+        valid = candidates[row] >= 0
+        overlap[row] = 0.0
+        overlap[row, valid] = d_matrix[candidates[row, valid]] @ q_matrix[row] / q_sizes[row]
+
+    similarity = np.where(candidates >= 0, similarity, 0.0)
+    return candidates, similarity, overlap
+
+
+# ===========================
+# 3. Grid Evaluation
+# ===========================
+def evaluate_grid(candidates, similarity, overlap, labels, semantic_weights,
+                  overlap_weights, k_values, thresholds, calls_per_survey):
+    """
+    Evaluates every (semantic_weight, overlap_weight, k, threshold) combination.
+    Scores are computed for all weights at once as a (weights, queries, max_k) array.
+    """
+    diseases = np.array([str(d) for d in rag.metadata["diseases"]] + [""])
+    candidate_diseases = diseases[candidates]  # -1 maps to the "" sentinel
+    labels = np.asarray(labels)[:, None]
+
+    weights = [(ws, wo) for ws in semantic_weights for wo in overlap_weights]
+    w_sem = np.array([w[0] for w in weights])[:, None, None]
+    w_ovl = np.array([w[1] for w in weights])[:, None, None]
+    scores = w_sem * similarity[None] + w_ovl * overlap[None]
+    # Padding ids (-1) never win: FAISS only returns them when k > ntotal
+    scores = np.where(candidates[None] >= 0, scores, -np.inf)
+
+    thresholds = np.asarray(thresholds)
+    n_queries = len(labels)
+    results = []
+
+    for k in k_values:
+        scores_k = scores[:, :, :k]
+        order = np.argsort(-scores_k, axis=2)
+        top_pos = order[:, :, 0]
+        top_score = np.take_along_axis(scores_k, top_pos[..., None], axis=2)[..., 0]
+        if k > 1:
+            second_pos = order[:, :, 1]
+            second_score = np.take_along_axis(scores_k, second_pos[..., None], axis=2)[..., 0]
+        else:
+            second_score = np.full(top_score.shape, -np.inf)
+
+        top_disease = np.take_along_axis(
+            np.broadcast_to(candidate_diseases[None, :, :k], scores_k.shape), top_pos[..., None], axis=2
+        )[..., 0]
+        correct = top_disease == labels[None, :, 0]          # (weights, queries)
+        accuracy = correct.mean(axis=1)
+
+        # Same rule as api_ask: top > t and every other candidate < t
+        t = thresholds[:, None, None]
+        skip = (top_score[None] > t) & (second_score[None] < t)  # (thresholds, weights, queries)
+        skip_rate = skip.mean(axis=2)
+        skip_accuracy = (skip & correct[None]).sum(axis=2) / np.maximum(skip.sum(axis=2), 1)
+
+        for wi, (ws, wo) in enumerate(weights):
+            for ti, threshold in enumerate(thresholds):
+                skipped = int(skip[ti, wi].sum())
+                results.append({
+                    "semantic_weight": float(ws),
+                    "overlap_weight": float(wo),
+                    "retrieval_k": int(k),
+                    "threshold": float(threshold),
+                    "accuracy": float(accuracy[wi]),
+                    "skip_rate": float(skip_rate[ti, wi]),
+                    "skip_accuracy": float(skip_accuracy[ti, wi]),
+                    "llm_calls_saved": skipped * calls_per_survey,
+                    "llm_calls_saved_per_query": skipped * calls_per_survey / max(n_queries, 1),
+                })
+    return results
+
+
+# ===========================
+# 4. CLI
+# ===========================
+def parse_grid(value):
+    """Parses '0.5:0.9:0.1' as a range or '3,5,10' as an explicit list."""
+    if ":" in value:
+        start, stop, step = (float(v) for v in value.split(":"))
+        return [round(v, 6) for v in np.arange(start, stop + step / 2, step)]
+    return [float(v) for v in value.split(",") if v.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep hybrid scoring parameters over a labeled query set.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--queries", help="CSV/JSONL file with 'symptoms' and 'disease' columns")
+    source.add_argument("--from-dataset", type=int, metavar="N",
+                        help="Sample N synthetic queries from the index metadata (smoke test only: "
+                             "queries are subsets of indexed records, so the true record always has "
+                             "overlap 1.0 and results favour high overlap weights)")
+    parser.add_argument("--extract-with-llm", action="store_true",
+                        help="Normalize each query once through extract_symptoms_via_llm before encoding")
+    parser.add_argument("--semantic-weights", default="0.0:1.0:0.1")
+    parser.add_argument("--overlap-weights", default="0.0:1.0:0.1")
+    parser.add_argument("--k-values", default="1,3,5,10,20")
+    parser.add_argument("--thresholds", default="0.5:0.9:0.05")
+    parser.add_argument("--calls-per-survey", type=int, default=4,
+                        help="LLM calls a survey costs (PatientView asks up to 4 questions, each re-running extraction)")
+    parser.add_argument("--top", type=int, default=15, help="Rows to print, ranked by accuracy then skip rate")
+    parser.add_argument("--output", help="Write the full grid to this CSV or JSON file")
+    args = parser.parse_args()
+    rag.load_resources()
+
+    if args.queries:
+        queries = load_labeled_queries(args.queries)
+    else:
+        queries = sample_queries_from_metadata(args.from_dataset)
+    if not queries:
+        raise ValueError("No labeled queries to evaluate.")
+
+    query_texts = [q["symptoms"] for q in queries]
+    if args.extract_with_llm:
+        query_texts = [", ".join(rag.extract_symptoms_via_llm(q)) for q in query_texts]
+
+    k_values = sorted({int(k) for k in parse_grid(args.k_values)})
+    print(f"🧪 Evaluating {len(queries)} queries...")
+
+    start = time.perf_counter()
+    candidates, similarity, overlap = build_score_matrices(query_texts, max(k_values))
+    print(f"📦 Cached score matrices in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    results = evaluate_grid(
+        candidates, similarity, overlap, [q["disease"] for q in queries],
+        parse_grid(args.semantic_weights), parse_grid(args.overlap_weights),
+        k_values, parse_grid(args.thresholds), args.calls_per_survey,
+    )
+    print(f"⚡ Evaluated {len(results)} settings in {time.perf_counter() - start:.2f}s")
+
+    current = (config.semantic_weight, config.overlap_weight, config.retrieval_k, config.confidence_threshold)
+    print(f"⚙️ Current config: semantic={current[0]}, overlap={current[1]}, k={current[2]}, threshold={current[3]}")
+
+    ranked = sorted(results, key=lambda r: (r["accuracy"], r["skip_rate"]), reverse=True)
+    print(f"\n{'w_sem':>6} {'w_ovl':>6} {'k':>3} {'thr':>5} {'acc':>6} {'skip':>6} {'skip_acc':>8} {'saved':>7}")
+    for r in ranked[:args.top]:
+        print(
+            f"{r['semantic_weight']:>6.2f} {r['overlap_weight']:>6.2f} {r['retrieval_k']:>3} "
+            f"{r['threshold']:>5.2f} {r['accuracy']:>6.3f} {r['skip_rate']:>6.3f} "
+            f"{r['skip_accuracy']:>8.3f} {r['llm_calls_saved']:>7}"
+        )
+
+    if args.output:
+        out_path = Path(args.output)
+        with open(out_path, 'w', encoding='utf-8', newline='') as f:
+            if out_path.suffix == ".json":
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            else:
+                writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+                writer.writeheader()
+                writer.writerows(results)
+        print(f"\n✅ Wrote {len(results)} rows to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
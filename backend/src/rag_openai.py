@@ -1,35 +1,134 @@
-import faiss
+import os
 import pickle
+import threading
+from types import SimpleNamespace
 import openai
-from sentence_transformers import SentenceTransformer
 from config_loader import config
+from tracing import tracer
 import json
+import time
 
 # ===========================
 # 1. Setup & Initialization
 # ===========================
 print("⚙️ System initializing...")
 
-# Get API Key from Config
-openai.api_key = config.get_openai_api_key()
+# Benchmarks only: when RAG_LLM_STUB_SECONDS is set, LLM calls sleep that long and
+# return canned JSON instead of calling OpenAI, so the rest of the serving path
+# (admission, coalescing, encode + search, logging) can be load-tested.
+LLM_STUB_SECONDS = float(os.environ["RAG_LLM_STUB_SECONDS"]) if os.environ.get("RAG_LLM_STUB_SECONDS") else None
+
+if LLM_STUB_SECONDS is not None:
+    print(f"⚠️ RAG_LLM_STUB_SECONDS={LLM_STUB_SECONDS}: LLM calls are stubbed (benchmark mode)")
+
+def ensure_api_key():
+    """
+    Sets the OpenAI API key from config on first use, so LLM-free runs (bulk
+    triage with --llm none, the hybrid sweep) work without credentials.
+    Raises ValueError if the key is needed but not configured.
+    """
+    if LLM_STUB_SECONDS is None and not openai.api_key:
+        openai.api_key = config.get_openai_api_key()
 
 # ===========================
 # 2. Load Data & Models
 # ===========================
-print("🔍 Loading FAISS index and metadata...")
-# Paths come from config.yaml
-index = faiss.read_index(config.faiss_index_path)
+# Loaded by load_resources(); torch/faiss are imported there so that importing
+# this module stays cheap and a server can bind before the models are ready.
+index = None
+metadata = None
+embedding_model = None
+_load_lock = threading.Lock()
+
+def load_resources():
+    """Loads the FAISS index, metadata and embedding model once. Safe to call repeatedly."""
+    global index, metadata, embedding_model
+    with _load_lock:
+        if embedding_model is not None:
+            return
+
+        import faiss
+        from sentence_transformers import SentenceTransformer
 
-with open(config.metadata_path, "rb") as f:
-    metadata = pickle.load(f)
+        print("🔍 Loading FAISS index and metadata...")
+        # Paths come from config.yaml
+        loaded_index = faiss.read_index(config.faiss_index_path)
 
-print(f"🧠 Loading embedding model: {config.embedding_model_name}...")
-embedding_model = SentenceTransformer(config.embedding_model_name)
+        with open(config.metadata_path, "rb") as f:
+            loaded_metadata = pickle.load(f)
+
+        print(f"🧠 Loading embedding model: {config.embedding_model_name}...")
+        loaded_model = SentenceTransformer(config.embedding_model_name)
+
+        index, metadata = loaded_index, loaded_metadata
+        embedding_model = loaded_model
+
+def warmup(batch_sizes=(1, 8, 32), k=None):
+    """
+    Runs encodes and searches across representative batch sizes so torch's lazy
+    initialization and allocator growth happen before the first real query.
+    Uses symptom lists from the metadata as realistic inputs.
+    """
+    load_resources()
+    if k is None:
+        k = config.retrieval_k
+
+    samples = [", ".join(sorted(extract_symptoms_from_text(t))) for t in metadata["texts"][:max(batch_sizes)]]
+    timings = {}
+    for batch_size in batch_sizes:
+        batch = (samples * batch_size)[:batch_size]
+        start = time.perf_counter()
+        query_emb = embedding_model.encode(batch, convert_to_numpy=True, batch_size=batch_size)
+        index.search(query_emb, k)
+        timings[batch_size] = time.perf_counter() - start
+        print(f"🔥 Warmup batch={batch_size}: {timings[batch_size] * 1000:.1f} ms")
+    return timings
 
 
 # ===========================
 # 3. Helper Functions
 # ===========================
+# Callables receiving (seconds, failed) for every LLM call, e.g. admission control
+llm_latency_listeners = []
+
+def _stub_completion(stage, messages):
+    """Canned response for benchmark mode: extraction echoes the comma-separated input."""
+    time.sleep(LLM_STUB_SECONDS)
+    if stage == "extract":
+        text = messages[-1]["content"].split(":", 1)[-1]
+        content = json.dumps({"symptoms": sorted(extract_symptoms_from_text(text))}, ensure_ascii=False)
+    else:
+        content = json.dumps({"patient_symptoms": [], "departments": [], "symptoms_to_ask": [],
+                              "disease_probabilities": [], "explanation": "stub"})
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+def chat_completion(stage, **kwargs):
+    """
+    Thin wrapper around the OpenAI chat API that reports call latency, including failed calls.
+    `stage` ('extract' or 'completion') labels the trace span.
+    """
+    ensure_api_key()
+    prompt_chars = sum(len(m["content"]) for m in kwargs.get("messages", []))
+    failed = True
+    start = time.perf_counter()
+    try:
+        with tracer.span("llm_call", stage=stage, model=kwargs.get("model"), prompt_chars=prompt_chars) as span:
+            if LLM_STUB_SECONDS is not None:
+                response = _stub_completion(stage, kwargs["messages"])
+            else:
+                response = openai.chat.completions.create(**kwargs)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                span["prompt_tokens"] = usage.prompt_tokens
+                span["completion_tokens"] = usage.completion_tokens
+        failed = False
+        return response
+    finally:
+        # Timeouts and API errors are the main overload signal; report them too
+        elapsed = time.perf_counter() - start
+        for listener in llm_latency_listeners:
+            listener(elapsed, failed=failed)
+
 def extract_symptoms_from_text(text):
     """
     Extract symptoms from text. Handles both:
@@ -59,47 +158,76 @@ def token_overlap(query, doc_text):
 
     return len(query_symptoms & doc_symptoms) / max(len(query_symptoms), 1)
 
-def retrieve_relevant_context(query, k=None):
+def retrieve_relevant_context(query, k=None, bundle=None):
     """
     Retrieve documents using hybrid search (Semantic + Token Overlap).
     Weights are pulled from config.yaml.
+    If a tenant bundle is given, its index and metadata are searched instead
+    of the global ones; the embedding model is always shared.
     """
+    return retrieve_relevant_contexts([query], k=k, bundle=bundle)[0]
+
+def retrieve_relevant_contexts(queries, k=None, bundle=None):
+    """
+    Batched retrieve_relevant_context: encodes all queries in one call and runs
+    a single FAISS search, then re-ranks each query's candidates.
+    Returns one document list per query.
+    """
+    load_resources()
+
     # Read k from config if not provided
     if k is None:
         k = config.retrieval_k
 
-    query_emb = embedding_model.encode([query], convert_to_numpy=True)
-    distances, indices = index.search(query_emb, k)
+    search_index = bundle.index if bundle is not None else index
+    search_metadata = bundle.metadata if bundle is not None else metadata
+
+    with tracer.span("encode", queries=len(queries), query_chars=sum(len(q) for q in queries)):
+        query_emb = embedding_model.encode(queries, convert_to_numpy=True)
+    with tracer.span("faiss_search", k=k, ntotal=search_index.ntotal):
+        distances, indices = search_index.search(query_emb, k)
 
-    retrieved = []
-    
     # Get weights from config
     w_semantic = config.semantic_weight
     w_overlap = config.overlap_weight
 
-    for idx, dist in zip(indices[0], distances[0]):
-        i = int(idx)
-        if i < len(metadata["texts"]):
-            doc_text = metadata["texts"][i]
-            similarity = 1 / (1 + dist)
-            overlap_score = token_overlap(query, doc_text)
-            
-            # Hybrid Score Calculation
-            similarity_f = float(similarity)
-            overlap_f = float(overlap_score)
-            final_score = float(w_semantic * similarity_f + w_overlap * overlap_f)
-
-            retrieved.append({
-                "text": str(doc_text),
-                "Disease": str(metadata["diseases"][i]),
-                "Department": str(metadata["departments"][i]),
-                "similarity": similarity_f,
-                "overlap": overlap_f,
-                "final_score": final_score
-            })
-
-    retrieved = sorted(retrieved, key=lambda x: x["final_score"], reverse=True)
-    return retrieved[:k]
+    results = []
+    with tracer.span("hybrid_rerank", candidates=indices.size):
+        for query, query_indices, query_distances in zip(queries, indices, distances):
+            retrieved = []
+            for idx, dist in zip(query_indices, query_distances):
+                i = int(idx)
+                if 0 <= i < len(search_metadata["texts"]):
+                    doc_text = search_metadata["texts"][i]
+                    similarity = 1 / (1 + dist)
+                    overlap_score = token_overlap(query, doc_text)
+                
+                    # Hybrid Score Calculation
+                    similarity_f = float(similarity)
+                    overlap_f = float(overlap_score)
+                    final_score = float(w_semantic * similarity_f + w_overlap * overlap_f)
+
+                    retrieved.append({
+                        "text": str(doc_text),
+                        "Disease": str(search_metadata["diseases"][i]),
+                        "Department": str(search_metadata["departments"][i]),
+                        "similarity": similarity_f,
+                        "overlap": overlap_f,
+                        "final_score": final_score
+                    })
+
+            retrieved = sorted(retrieved, key=lambda x: x["final_score"], reverse=True)
+            results.append(retrieved[:k])
+    return results
+
+def is_high_confidence(docs, threshold=None):
+    """Question-skip rule: the top doc scores above the threshold and every other doc below it."""
+    if not docs:
+        return False
+    if threshold is None:
+        threshold = config.confidence_threshold
+    top_score = docs[0].get('final_score', 0)
+    return top_score > threshold and all(doc.get('final_score', 0) < threshold for doc in docs[1:])
 
 def format_context(docs):
     formatted = []
@@ -133,7 +261,8 @@ def extract_symptoms_via_llm(user_input):
     
     user_prompt = f"Kullanıcının metni: {user_input}"
     
-    response = openai.chat.completions.create(
+    response = chat_completion(
+        "extract",
         model=config.llm_model_name,
         messages=[
             {"role": "system", "content": system_prompt},
@@ -164,14 +293,26 @@ def extract_symptoms_via_llm(user_input):
 # ===========================
 # 5. Core RAG Logic
 # ===========================
-def ask_gpt4(user_input):
-    normalized_symptoms = extract_symptoms_via_llm(user_input)
+def retrieve_for_input(user_input, k=None, bundle=None):
+    """
+    Retrieval stage of the pipeline: LLM symptom extraction + hybrid search.
+    Returns (normalized_symptoms, retrieved_docs).
+    """
+    with tracer.span("extract_symptoms", input_chars=len(user_input)) as span:
+        normalized_symptoms = extract_symptoms_via_llm(user_input)
+        span["symptoms"] = len(normalized_symptoms)
     normalized_query = ", ".join(normalized_symptoms)
     
     print(f"🔍 Normalized Query: {normalized_query}")
     
     # Retrieve
-    retrieved_docs = retrieve_relevant_context(normalized_query)
+    with tracer.span("retrieve"):
+        retrieved_docs = retrieve_relevant_context(normalized_query, k=k, bundle=bundle)
+    return normalized_symptoms, retrieved_docs
+
+def generate_answer(normalized_symptoms, retrieved_docs):
+    """Completion stage of the pipeline: asks the LLM to reason over the retrieved records."""
+    normalized_query = ", ".join(normalized_symptoms)
     context_text = format_context(retrieved_docs)
 
     system_prompt = (
@@ -200,16 +341,23 @@ def ask_gpt4(user_input):
 
     user_prompt = f"Veri tabanı kayıtları:\n{context_text}\n\nKullanıcının belirtileri: {normalized_query}"
 
-    response = openai.chat.completions.create(
-        model=config.llm_model_name,  # Get model name from Config (gpt-4o-mini)
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=config.temperature, # Get temperature from Config (0.2)
-    )
+    with tracer.span("completion", context_docs=len(retrieved_docs)):
+        response = chat_completion(
+            "completion",
+            model=config.llm_model_name,  # Get model name from Config (gpt-4o-mini)
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=config.temperature, # Get temperature from Config (0.2)
+        )
+
+    return response.choices[0].message.content
 
-    return response.choices[0].message.content, retrieved_docs, normalized_symptoms
+def ask_gpt4(user_input, bundle=None):
+    normalized_symptoms, retrieved_docs = retrieve_for_input(user_input, bundle=bundle)
+    answer = generate_answer(normalized_symptoms, retrieved_docs)
+    return answer, retrieved_docs, normalized_symptoms
 
 # ===========================
 # Main Execution
@@ -0,0 +1,198 @@
+"""
+Preforked production launcher.
+
+The parent process loads the FAISS index, metadata and SentenceTransformer
+once, binds the listening socket, then forks workers. Workers inherit the
+loaded model copy-on-write, so its pages stay shared instead of being
+duplicated per process. Each worker caps torch/faiss threads so that
+workers x threads does not oversubscribe the cores, and serves the app with
+waitress (a production WSGI server) on the inherited socket.
+Crashed workers are restarted with exponential backoff; a slot that keeps
+failing right after start is given up after `max_restarts` attempts.
+
+Usage (from backend/src):
+    python serve.py --workers 4 --threads-per-worker 2
+    python serve.py --memory-report 60   # print per-worker memory after 60s
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from config_loader import config
+from tracing import process_memory
+
+
+# ===========================
+# 1. Memory Accounting
+# ===========================
+def print_memory_report(parent_pid, worker_pids):
+    print("\n📊 Memory per process (MB)")
+    print(f"{'process':>12} {'rss':>9} {'pss':>9} {'shared':>9} {'private':>9}")
+    total_pss = 0.0
+    for label, pid in [("parent", parent_pid)] + [(f"worker {i}", p) for i, p in enumerate(worker_pids)]:
+        mem = process_memory(pid)
+        if mem is None:
+            print(f"{label:>12} {'n/a':>9}")
+            continue
+        total_pss += mem["pss_mb"]
+        print(f"{label:>12} {mem['rss_mb']:>9.1f} {mem['pss_mb']:>9.1f} {mem['shared_mb']:>9.1f} {mem['private_mb']:>9.1f}")
+    print(f"{'total pss':>12} {total_pss:>9.1f}\n")
+
+
+# ===========================
+# 2. Worker
+# ===========================
+def run_worker(sock, threads, http_threads, started_at, preload_seconds):
+    """Child process: caps compute threads, starts background work and serves on the shared socket."""
+    import torch
+    import faiss
+    from waitress import serve
+    import web_app
+
+    torch.set_num_threads(threads)
+    faiss.omp_set_num_threads(threads)
+
+    # Resources are already loaded (inherited); this registers the default
+    # tenant and warms up with this worker's thread settings.
+    web_app.start_background_work(started_at=started_at, parent_preload_seconds=preload_seconds)
+
+    print(f"👷 Worker {os.getpid()} serving with {threads} torch thread(s), {http_threads} request thread(s)")
+    try:
+        serve(web_app.app, sockets=[sock], threads=http_threads, ident="rag-triage")
+    finally:
+        # Runs on SIGTERM too (see spawn); the child leaves via os._exit, which skips atexit
+        web_app.stop_background_work()
+
+
+# ===========================
+# 3. Supervisor
+# ===========================
+def main():
+    settings = config.server
+    parser = argparse.ArgumentParser(description="Preforked server sharing model memory across workers.")
+    parser.add_argument("--host", default=settings['host'])
+    parser.add_argument("--port", type=int, default=settings['port'])
+    parser.add_argument("--workers", type=int, default=settings['workers'])
+    parser.add_argument("--threads-per-worker", type=int, default=settings['threads_per_worker'])
+    parser.add_argument("--http-threads", type=int, default=settings['http_threads'],
+                        help="Request threads per worker (waitress)")
+    parser.add_argument("--memory-report", type=float, metavar="SECONDS",
+                        help="Print per-process memory this many seconds after the workers start")
+    args = parser.parse_args()
+
+    threads = max(1, args.threads_per_worker)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // threads)
+
+    # Must be set before torch/OpenMP initialize so every pool is sized per worker
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    os.environ["RAG_PREFORK"] = "1"
+
+    import rag_openai as rag
+
+    preload_start = time.monotonic()
+    rag.load_resources()
+    print(f"📦 Parent {os.getpid()} loaded model and index in {time.monotonic() - preload_start:.2f}s")
+
+    # Import the app in the parent too, so workers inherit its module state
+    import web_app  # noqa: F401
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    # Move everything allocated so far out of the GC's reach; otherwise the
+    # first collection in each worker touches (and un-shares) every object.
+    gc.collect()
+    gc.freeze()
+    preload_seconds = time.monotonic() - preload_start
+
+    children = {}   # pid -> (slot, started_at)
+    failures = {}   # slot -> consecutive crashes shortly after start
+    restarts = {}   # slot -> monotonic time of the scheduled restart
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            started_at = time.monotonic()  # This worker's cold start begins at the fork
+            # SystemExit unwinds serve_forever so the worker can flush before exiting
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+            code = 1
+            try:
+                run_worker(sock, threads, args.http_threads, started_at, preload_seconds)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            finally:
+                os._exit(code)
+        children[pid] = (slot, time.monotonic())
+
+    for slot in range(workers):
+        spawn(slot)
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {workers} worker(s) x {threads} thread(s)")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    report_at = time.monotonic() + args.memory_report if args.memory_report else None
+    while children or (restarts and not stopping):
+        now = time.monotonic()
+        if report_at is not None and now >= report_at:
+            print_memory_report(os.getpid(), sorted(children))
+            report_at = None
+
+        for slot, restart_at in list(restarts.items()):
+            if now >= restart_at and not stopping:
+                del restarts[slot]
+                # Respawned workers fork from the parent, so they still share the loaded model
+                spawn(slot)
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+
+        slot, started_at = children.pop(pid)
+        if stopping:
+            continue
+
+        # A worker that ran for a while crashed on its own; one that dies at
+        # startup (import error, bad socket) would otherwise fork in a tight loop.
+        if now - started_at >= settings['restart_min_uptime_seconds']:
+            failures[slot] = 0
+        failures[slot] = failures.get(slot, 0) + 1
+        if failures[slot] > settings['max_restarts']:
+            print(f"❌ Worker slot {slot} failed {failures[slot]} times in a row (last status {status}); not restarting")
+            continue
+        delay = min(settings['restart_backoff_max_seconds'], 0.5 * 2 ** (failures[slot] - 1))
+        print(f"⚠️ Worker {pid} exited with status {status}; restarting in {delay:.1f}s")
+        restarts[slot] = now + delay
+
+    sock.close()
+    # Non-zero when every worker slot was given up, so a process manager notices
+    sys.exit(0 if stopping else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+# ===========================
+# 1. Helpers
+# ===========================
+def canonical_symptoms(text):
+    """Canonical form used for coalescing: lowercased, whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+
+class FlightTimeout(TimeoutError):
+    """Raised to a follower whose deadline passed while the leader was still running."""
+
+
+# ===========================
+# 2. Single-Flight Group
+# ===========================
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires_at = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation.
+    The first caller (leader) runs the function; callers arriving while it is
+    in flight wait for it and receive the same result or exception.
+    A successful result stays shareable for `linger_seconds` after completion,
+    which covers back-to-back requests such as a skip_llm check followed by
+    the full request for the same symptoms. Errors are never shared afterwards.
+    """
+    def __init__(self, linger_seconds=0.0):
+        self.linger_seconds = linger_seconds
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"executed": 0, "coalesced": 0, "wait_timeouts": 0}
+
+    def _purge_expired(self, now):
+        """Caller holds the lock."""
+        expired = [k for k, c in self._calls.items() if c.expires_at is not None and c.expires_at <= now]
+        for key in expired:
+            del self._calls[key]
+
+    def do(self, key, fn, deadline=None):
+        """
+        Runs fn() once per key across concurrent callers. `deadline` is a
+        time.monotonic() timestamp bounding how long a follower waits for the
+        leader; past it, the follower raises FlightTimeout (the leader keeps running).
+        """
+        return self.do_shared(key, fn, deadline)[0]
+
+    def do_shared(self, key, fn, deadline=None):
+        """Like do(), but returns (result, shared); shared is True when another caller computed it."""
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self._stats["wait_timeouts"] += 1
+                raise FlightTimeout(f"deadline passed while waiting for coalesced call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        succeeded = False
+        try:
+            call.result = fn()
+            succeeded = True
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # KeyboardInterrupt/SystemExit belong to the leader's thread; followers get a plain failure
+            call.error = RuntimeError(f"coalesced call {key!r} was interrupted")
+            raise
+        finally:
+            with self._lock:
+                # Only results of a normal return are kept for late arrivals
+                if succeeded and self.linger_seconds > 0:
+                    call.expires_at = time.monotonic() + self.linger_seconds
+                else:
+                    del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(1 for c in self._calls.values() if not c.done.is_set())
+            return dict(self._stats, in_flight=in_flight)
@@ -0,0 +1,162 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from config_loader import config
+
+
+# ===========================
+# 1. Tenant Bundle
+# ===========================
+class TenantBundle:
+    """
+    One hospital's retrieval data: FAISS index + metadata (diseases, departments, texts).
+    The embedding model is not part of the bundle; all tenants share rag_openai's model.
+    """
+    def __init__(self, tenant_id, index, metadata, size_bytes, pinned=False):
+        self.tenant_id = tenant_id
+        self.index = index
+        self.metadata = metadata
+        self.size_bytes = size_bytes
+        self.pinned = pinned
+        self.loaded_at = time.time()
+
+def _estimate_bundle_bytes(index, metadata_path):
+    """Flat index vectors (float32) plus the pickled metadata size on disk."""
+    return index.ntotal * index.d * 4 + os.path.getsize(metadata_path)
+
+def load_bundle(tenant_id):
+    import faiss  # Lazy, like rag_openai: keeps module import cheap
+
+    index_path, metadata_path = config.tenant_paths(tenant_id)
+    print(f"🏥 Loading retrieval bundle for tenant '{tenant_id}'...")
+    index = faiss.read_index(index_path)
+    with open(metadata_path, "rb") as f:
+        metadata = pickle.load(f)
+    return TenantBundle(tenant_id, index, metadata, _estimate_bundle_bytes(index, metadata_path))
+
+def load_default_bundle(index, metadata):
+    """
+    Pinned bundle for the default tenant. When its configured site points at the
+    same files as paths.* it reuses the index/metadata rag_openai already loaded;
+    otherwise the site's own files are loaded.
+    """
+    index_path, metadata_path = config.tenant_paths(config.default_tenant)
+    shared = (os.path.realpath(index_path) == os.path.realpath(config.faiss_index_path)
+              and os.path.realpath(metadata_path) == os.path.realpath(config.metadata_path))
+    if shared:
+        bundle = TenantBundle(config.default_tenant, index, metadata, _estimate_bundle_bytes(index, metadata_path))
+    else:
+        bundle = load_bundle(config.default_tenant)
+    bundle.pinned = True
+    return bundle
+
+
+# ===========================
+# 2. LRU Registry
+# ===========================
+class TenantRegistry:
+    """
+    Resolves a tenant id to its retrieval bundle.
+    Bundles load lazily on first use and are evicted least-recently-used first
+    once the total estimated size exceeds the memory budget. Pinned bundles
+    (the default tenant, already loaded by rag_openai) are never evicted.
+    """
+    def __init__(self, memory_budget_mb=None, loader=load_bundle):
+        if memory_budget_mb is None:
+            memory_budget_mb = config.tenant_memory_budget_mb
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self._loader = loader
+        self._bundles = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._metrics = {}
+
+    def _tenant_metrics(self, tenant_id):
+        if tenant_id not in self._metrics:
+            self._metrics[tenant_id] = {
+                "requests": 0,
+                "hits": 0,
+                "loads": 0,
+                "evictions": 0,
+                "load_seconds_total": 0.0,
+                "last_used": None,
+            }
+        return self._metrics[tenant_id]
+
+    def register(self, bundle):
+        """Adds an already-loaded bundle (e.g. the default tenant) to the registry."""
+        with self._lock:
+            self._bundles[bundle.tenant_id] = bundle
+            self._bundles.move_to_end(bundle.tenant_id)
+            self._tenant_metrics(bundle.tenant_id)
+            self._evict_over_budget()
+
+    def get(self, tenant_id):
+        """Returns the tenant's bundle, loading it if needed. Raises KeyError for unknown tenants."""
+        if tenant_id not in self._bundles:
+            config.tenant_paths(tenant_id)  # Raises KeyError before any metrics are recorded
+
+        with self._lock:
+            metrics = self._tenant_metrics(tenant_id)
+            metrics["requests"] += 1
+            metrics["last_used"] = time.time()
+            bundle = self._bundles.get(tenant_id)
+            if bundle is not None:
+                metrics["hits"] += 1
+                self._bundles.move_to_end(tenant_id)
+                return bundle
+            load_lock = self._load_locks.setdefault(tenant_id, threading.Lock())
+
+        # Load outside the registry lock so other tenants keep being served;
+        # the per-tenant lock makes concurrent first requests load only once.
+        with load_lock:
+            with self._lock:
+                bundle = self._bundles.get(tenant_id)
+                if bundle is not None:
+                    # Loaded by a concurrent request while this one waited
+                    metrics["hits"] += 1
+                    self._bundles.move_to_end(tenant_id)
+                    return bundle
+
+            start = time.perf_counter()
+            bundle = self._loader(tenant_id)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                metrics["loads"] += 1
+                metrics["load_seconds_total"] += elapsed
+                self._bundles[tenant_id] = bundle
+                self._evict_over_budget()
+            print(f"✅ Tenant '{tenant_id}' loaded in {elapsed:.2f}s ({bundle.size_bytes / 1024 / 1024:.1f} MB)")
+            return bundle
+
+    def _evict_over_budget(self):
+        """Drops least-recently-used unpinned bundles until the budget fits. Caller holds the lock."""
+        total = sum(b.size_bytes for b in self._bundles.values())
+        for tenant_id in list(self._bundles.keys()):
+            if total <= self.memory_budget_bytes:
+                break
+            bundle = self._bundles[tenant_id]
+            if bundle.pinned or tenant_id == next(reversed(self._bundles)):
+                # Never evict pinned bundles or the one just requested
+                continue
+            del self._bundles[tenant_id]
+            total -= bundle.size_bytes
+            self._metrics[tenant_id]["evictions"] += 1
+            print(f"♻️ Evicted tenant '{tenant_id}' from memory ({bundle.size_bytes / 1024 / 1024:.1f} MB)")
+
+    def metrics(self):
+        with self._lock:
+            loaded = {tid: b.size_bytes for tid, b in self._bundles.items()}
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "memory_used_bytes": sum(loaded.values()),
+                "loaded_tenants": list(loaded.keys()),
+                "tenants": {
+                    tid: dict(m, loaded=tid in loaded, size_bytes=loaded.get(tid, 0))
+                    for tid, m in self._metrics.items()
+                },
+            }
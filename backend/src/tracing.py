@@ -0,0 +1,206 @@
+import contextvars
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from config_loader import config
+
+
+# ===========================
+# 1. Span Tracing
+# ===========================
+class Trace:
+    def __init__(self, trace_id, name, attrs):
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.tid = threading.get_ident()
+        self.spans = []
+        self.depth = 0
+
+    def stage_durations_ms(self):
+        """Total milliseconds per span name, for finished spans only."""
+        durations = {}
+        for s in self.spans:
+            if "end_ns" in s:
+                durations[s["name"]] = durations.get(s["name"], 0.0) + (s["end_ns"] - s["start_ns"]) / 1e6
+        return durations
+
+    def elapsed_ms(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attrs": self.attrs,
+            "started_at": self.started_at,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "spans": [
+                {
+                    "name": s["name"],
+                    "depth": s["depth"],
+                    "offset_ms": (s["start_ns"] - self.start_ns) / 1e6,
+                    "duration_ms": (s["end_ns"] - s["start_ns"]) / 1e6,
+                    "attrs": s["attrs"],
+                }
+                for s in self.spans
+            ],
+        }
+
+class Tracer:
+    """
+    Lightweight per-request span tracing.
+    Spans attach to the trace active in the current context; outside a trace
+    span() is a no-op, so library code can be instrumented unconditionally.
+    Finished traces are kept in a bounded ring buffer (oldest dropped first).
+    """
+    def __init__(self, capacity=256, enabled=True):
+        self.enabled = enabled
+        self._buffer = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._current = contextvars.ContextVar("current_trace", default=None)
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        if not self.enabled:
+            yield None
+            return
+
+        trace = Trace(next(self._ids), name, attrs)
+        token = self._current.set(trace)
+        try:
+            yield trace
+        finally:
+            trace.end_ns = time.perf_counter_ns()
+            self._current.reset(token)
+            with self._lock:
+                self._buffer.append(trace)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        trace = self._current.get()
+        if trace is None:
+            yield attrs
+            return
+
+        record = {"name": name, "depth": trace.depth, "attrs": attrs, "start_ns": time.perf_counter_ns()}
+        trace.spans.append(record)  # Start order, so parents precede their children
+        trace.depth += 1
+        try:
+            # Callers may add attributes (result sizes etc.) to the yielded dict
+            yield attrs
+        finally:
+            trace.depth -= 1
+            record["end_ns"] = time.perf_counter_ns()
+
+    def current(self):
+        """The trace active in this context, or None."""
+        return self._current.get()
+
+    def recent(self, limit=None):
+        with self._lock:
+            traces = list(self._buffer)
+        if limit:
+            traces = traces[-limit:]
+        return traces
+
+    def export_json(self, limit=None):
+        return [t.to_dict() for t in self.recent(limit)]
+
+    def export_chrome(self, limit=None):
+        """Chrome trace-event format (chrome://tracing, Perfetto): one complete event per span."""
+        pid = os.getpid()
+        events = []
+        for trace in self.recent(limit):
+            events.append({
+                "name": trace.name, "ph": "X", "pid": pid, "tid": trace.tid,
+                "ts": trace.start_ns / 1e3, "dur": (trace.end_ns - trace.start_ns) / 1e3,
+                "args": dict(trace.attrs, trace_id=trace.trace_id),
+            })
+            for s in trace.spans:
+                events.append({
+                    "name": s["name"], "ph": "X", "pid": pid, "tid": trace.tid,
+                    "ts": s["start_ns"] / 1e3, "dur": (s["end_ns"] - s["start_ns"]) / 1e3,
+                    "args": dict(s["attrs"], trace_id=trace.trace_id),
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+# ===========================
+# 2. Sampling Profiler
+# ===========================
+_profile_lock = threading.Lock()
+
+def _folded_stack(frame):
+    """Root-first 'module:function' frames joined with ';' (Brendan Gregg's folded format)."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def sample_stacks(seconds, interval=0.01):
+    """
+    Samples every other thread's stack each `interval` seconds for `seconds`.
+    Returns a Counter of folded stacks. Only one profile runs at a time.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+
+    try:
+        own_id = threading.get_ident()
+        counts = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    counts[_folded_stack(frame)] += 1
+            time.sleep(interval)
+        return counts
+    finally:
+        _profile_lock.release()
+
+def to_folded(counts):
+    """Text accepted by flamegraph.pl, speedscope and inferno: '<stack> <count>' per line."""
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+# ===========================
+# 3. Process Memory
+# ===========================
+def process_memory(pid="self"):
+    """
+    RSS/PSS/shared/private memory in MB from /proc/<pid>/smaps_rollup (Linux).
+    PSS splits each shared page across the processes mapping it, so summing PSS
+    over the parent and workers gives the real total.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1].isdigit():
+                    fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    except OSError:
+        return None
+
+    shared = fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    private = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {"rss_mb": fields.get("Rss", 0), "pss_mb": fields.get("Pss", 0), "shared_mb": shared, "private_mb": private}
+
+
+# ===========================
+# Singleton Instance
+# ===========================
+tracer = Tracer(capacity=config.tracing['buffer_size'], enabled=config.tracing['enabled'])
@@ -0,0 +1,271 @@
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from config_loader import config
+
+
+# ===========================
+# 1. Schema
+# ===========================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS triage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    tenant TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    input_text TEXT NOT NULL,
+    normalized_symptoms TEXT NOT NULL,
+    symptom_key TEXT NOT NULL,
+    top_docs TEXT NOT NULL,
+    department TEXT,
+    should_skip_questions INTEGER NOT NULL,
+    stage_latency_ms TEXT NOT NULL,
+    total_latency_ms REAL,
+    coalesced INTEGER NOT NULL DEFAULT 0,
+    final INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_triage_events_ts ON triage_events (ts);
+CREATE INDEX IF NOT EXISTS idx_triage_events_tenant_ts ON triage_events (tenant, ts);
+"""
+
+# Columns added after the first release; ALTERed into older databases on open
+MIGRATIONS = {
+    "coalesced": "ALTER TABLE triage_events ADD COLUMN coalesced INTEGER NOT NULL DEFAULT 0",
+    "final": "ALTER TABLE triage_events ADD COLUMN final INTEGER",
+}
+
+INSERT = """
+INSERT INTO triage_events (
+    ts, tenant, mode, input_text, normalized_symptoms, symptom_key, top_docs,
+    department, should_skip_questions, stage_latency_ms, total_latency_ms,
+    coalesced, final
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# One patient produces several events (full request, survey skip_llm checks,
+# the coalesced doctor-info request). Aggregates count one event per triage:
+# those the client marked final, or, when it did not say, uncoalesced full runs.
+COUNTED_EVENTS = "(final = 1 OR (final IS NULL AND mode = 'full' AND coalesced = 0))"
+
+EVENT_COLUMNS = (
+    "id, ts, tenant, mode, normalized_symptoms, symptom_key, top_docs, department, "
+    "should_skip_questions, stage_latency_ms, total_latency_ms, coalesced, final"
+)
+
+_STOP = object()
+
+def _connect(path):
+    # Several worker processes may share one database file; wait on their write locks
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ===========================
+# 2. Background Writer
+# ===========================
+class TriageLog:
+    """
+    Append-only triage event log in a local SQLite database.
+    record() only enqueues (never touches disk on the request path); a writer
+    thread drains the queue and commits events in batches. When the queue is
+    full, events are dropped and counted rather than blocking requests.
+    stop() (registered with atexit by start()) flushes what is still queued.
+    """
+    def __init__(self, path, batch_size=100, flush_interval=1.0, queue_size=10000):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "write_errors": 0}
+        self._stats_lock = threading.Lock()
+        self._writer = None
+
+        conn = _connect(self.path)
+        try:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(triage_events)")}
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, name="triage-log-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5.0):
+        """Writes every event queued so far, then stops the writer thread."""
+        writer, self._writer = self._writer, None
+        if writer is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            print("⚠️ Triage log queue still full at shutdown; pending events may be lost")
+            return
+        writer.join(timeout)
+
+    def record(self, tenant, mode, input_text, normalized_symptoms, docs,
+               should_skip_questions, stage_latency_ms, total_latency_ms=None,
+               coalesced=False, final=None):
+        """
+        `coalesced`: the result was shared from another request's computation.
+        `final`: the client marked this request as the one that decides the
+        triage (True/False), or None when it did not say.
+        """
+        symptoms = sorted({s.strip().lower() for s in normalized_symptoms if s and s.strip()})
+        top_docs = [
+            {"Disease": d.get("Disease"), "Department": d.get("Department"), "final_score": d.get("final_score")}
+            for d in docs[:5]
+        ]
+        row = (
+            time.time(), tenant, mode, input_text,
+            json.dumps(list(normalized_symptoms), ensure_ascii=False),
+            ", ".join(symptoms),
+            json.dumps(top_docs, ensure_ascii=False),
+            docs[0].get("Department") if docs else None,
+            int(bool(should_skip_questions)),
+            json.dumps(stage_latency_ms),
+            total_latency_ms,
+            int(bool(coalesced)),
+            None if final is None else int(bool(final)),
+        )
+        try:
+            self._queue.put_nowait(row)
+            self._bump("enqueued")
+        except queue.Full:
+            self._bump("dropped")
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _run(self):
+        conn = _connect(self.path)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            stopping = item is _STOP
+            batch = [] if stopping else [item]
+            deadline = time.monotonic() + self.flush_interval
+            while not stopping and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+            if batch:
+                self._write(conn, batch)
+        conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(INSERT, batch)
+            self._bump("written", len(batch))
+            self._bump("batches")
+        except sqlite3.Error as e:
+            print(f"⚠️ Triage log write failed ({len(batch)} events): {e}")
+            self._bump("write_errors")
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, queue_depth=self._queue.qsize())
+
+    # ----- aggregate queries -----
+
+    def _query(self, sql, params):
+        # Readers use their own connection; WAL lets them run alongside the writer
+        conn = _connect(self.path)
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(r) for r in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _range_filter(start, end, tenant):
+        clauses, params = ["ts >= ?", "ts < ?"], [start, end]
+        if tenant:
+            clauses.append("tenant = ?")
+            params.append(tenant)
+        return " AND ".join(clauses), params
+
+    def department_volumes(self, start, end, tenant=None):
+        where, params = self._range_filter(start, end, tenant)
+        return self._query(
+            f"SELECT COALESCE(department, 'Bilinmiyor') AS department, COUNT(*) AS count, "
+            f"AVG(should_skip_questions) AS skip_rate, AVG(total_latency_ms) AS avg_latency_ms "
+            f"FROM triage_events WHERE {where} AND {COUNTED_EVENTS} GROUP BY department ORDER BY count DESC",
+            params,
+        )
+
+    def top_symptom_combinations(self, start, end, tenant=None, limit=20):
+        where, params = self._range_filter(start, end, tenant)
+        return self._query(
+            f"SELECT symptom_key AS symptoms, COUNT(*) AS count "
+            f"FROM triage_events WHERE {where} AND {COUNTED_EVENTS} AND symptom_key != '' "
+            f"GROUP BY symptom_key ORDER BY count DESC LIMIT ?",
+            params + [limit],
+        )
+
+    def recent_events(self, start, end, tenant=None, limit=100, include_text=False):
+        """Every event, newest first. Raw complaint text is left out unless include_text."""
+        where, params = self._range_filter(start, end, tenant)
+        columns = EVENT_COLUMNS + (", input_text" if include_text else "")
+        rows = self._query(
+            f"SELECT {columns} FROM triage_events WHERE {where} ORDER BY ts DESC LIMIT ?",
+            params + [limit],
+        )
+        for row in rows:
+            for field in ("normalized_symptoms", "top_docs", "stage_latency_ms"):
+                row[field] = json.loads(row[field])
+            row["should_skip_questions"] = bool(row["should_skip_questions"])
+            row["coalesced"] = bool(row["coalesced"])
+            row["final"] = None if row["final"] is None else bool(row["final"])
+        return rows
+
+
+def parse_time(value, default):
+    """Accepts epoch seconds or an ISO 8601 date/datetime; returns epoch seconds."""
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+# ===========================
+# 3. Factory
+# ===========================
+def create_triage_log():
+    """Builds the log from config.yaml (writer not started yet); None when disabled."""
+    settings = config.triage_log
+    if not settings['enabled']:
+        return None
+    path = config.backend_root / settings['path']
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return TriageLog(
+        path,
+        batch_size=settings['batch_size'],
+        flush_interval=settings['flush_interval_seconds'],
+        queue_size=settings['queue_size'],
+    )
@@ -1,62 +1,400 @@
 import os
+import time
+# Taken before any heavy import; reference point for the cold-start-to-ready metric
+PROCESS_STARTED_AT = time.monotonic()
+
 # Set to use pure-Python protobuf implementation for compatibility with zemberek-grpc
 os.environ['PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION'] = 'python'
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 import traceback
 import json
+import math
+import threading
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+# Admin and analytics routes expose traces and patient data; never readable cross-origin
+CORS(app, resources={r"/api/(?!admin/|analytics/).*": {"origins": "*"}})
 
-# Load RAG module once at startup (not lazy)
-print("🚀 Loading RAG module at startup...")
+# Importing rag_openai is cheap; the index and models load in the background
+# (see start_background_work) so the port binds immediately.
 import rag_openai as rag
-print("✅ RAG module loaded successfully!")
+from config_loader import config
+from tenant_registry import TenantRegistry, load_default_bundle
+from single_flight import SingleFlight, FlightTimeout, canonical_symptoms
+from admission_control import AdmissionController, RequestShed
+from tracing import tracer, sample_stacks, to_folded, process_memory
+from triage_log import create_triage_log, parse_time
+
+tenants = TenantRegistry()
+
+# ===========================
+# Background model loading & readiness
+# ===========================
+startup = {
+  'ready': False,
+  'error': None,
+  'load_seconds': None,
+  'warmup_seconds': None,
+  'cold_start_to_ready_seconds': None,
+  # Preforked workers only: time the serve.py parent spent loading before forking
+  'parent_preload_seconds': None,
+}
+
+def load_and_warm_up(started_at):
+  """
+  Loads index/metadata/model, registers the default tenant and runs warmup, then flips readiness.
+  `started_at` is the monotonic time this process started (a forked worker: its fork time).
+  """
+  try:
+    # The server always needs the LLM; report a missing key as a startup error
+    rag.ensure_api_key()
+    print("🚀 Loading RAG models in the background...")
+    start = time.monotonic()
+    rag.load_resources()
+    startup['load_seconds'] = time.monotonic() - start
+
+    # The default tenant reuses rag_openai's index/metadata when its site points at the same files
+    tenants.register(load_default_bundle(rag.index, rag.metadata))
+
+    start = time.monotonic()
+    rag.warmup(batch_sizes=config.warmup_batch_sizes)
+    startup['warmup_seconds'] = time.monotonic() - start
+
+    startup['cold_start_to_ready_seconds'] = time.monotonic() - started_at
+    startup['ready'] = True
+    print(f"✅ RAG ready in {startup['cold_start_to_ready_seconds']:.2f}s since process start")
+  except Exception as e:
+    startup['error'] = str(e)
+    print(f"❌ RAG loading failed: {e}")
+    traceback.print_exc()
+
+def start_background_work(started_at=PROCESS_STARTED_AT, parent_preload_seconds=None):
+  """
+  Starts this process's threads: model loading/warmup and the triage log writer.
+  Forked workers pass their own `started_at`; PROCESS_STARTED_AT is the parent's
+  import time, and a worker respawned later would otherwise report its age.
+  """
+  startup['parent_preload_seconds'] = parent_preload_seconds
+  if triage_log is not None:
+    triage_log.start()
+  threading.Thread(target=load_and_warm_up, args=(started_at,), name='rag-loader', daemon=True).start()
+
+def stop_background_work():
+  """Flushes queued triage events; for shutdown paths that skip atexit (e.g. os._exit in serve.py workers)."""
+  if triage_log is not None:
+    triage_log.stop()
+
+def not_ready_response():
+  body = {'error': 'models are still loading'} if not startup['error'] else {'error': 'model loading failed', 'detail': startup['error']}
+  return jsonify(body), 503, {'Retry-After': '5'}
+
+def resolve_tenant(data):
+  """Tenant id comes from the X-Tenant-ID header or a 'tenant' field, else the default site."""
+  tenant_id = request.headers.get('X-Tenant-ID') or data.get('tenant') or config.default_tenant
+  return tenants.get(str(tenant_id).strip())
+
+# Identical requests in flight share one computation. Retrieval (extraction +
+# search) and the full pipeline are coalesced separately so a full request can
+# reuse the retrieval stage of a skip_llm request for the same symptoms.
+flights = SingleFlight(linger_seconds=config.coalesce_linger_seconds)
+
+# Bounded per-priority queues and an LLM-latency-driven concurrency limit
+admission_settings = config.admission
+admission = AdmissionController(
+  priorities=admission_settings['priorities'],
+  queue_sizes=admission_settings['queue_sizes'],
+  initial_limit=admission_settings['initial_concurrency'],
+  min_limit=admission_settings['min_concurrency'],
+  max_limit=admission_settings['max_concurrency'],
+  target_latency=admission_settings['target_llm_latency_seconds'],
+  max_latency_sample=admission_settings['max_latency_sample_seconds'],
+  decay_half_life=admission_settings['latency_decay_half_life_seconds'],
+)
+rag.llm_latency_listeners.append(admission.observe_llm_latency)
+
+def request_deadline(data):
+  """
+  Monotonic deadline from the X-Request-Timeout header (seconds), else the configured default.
+  Missing, non-numeric, non-finite or non-positive values get the default; larger ones are
+  clamped to max_deadline_seconds.
+  """
+  timeout = request.headers.get('X-Request-Timeout') or data.get('timeout')
+  try:
+    timeout = float(timeout)
+  except (TypeError, ValueError):
+    timeout = None
+  if timeout is None or not math.isfinite(timeout) or timeout <= 0:
+    timeout = admission_settings['default_deadline_seconds']
+  return time.monotonic() + min(timeout, admission_settings['max_deadline_seconds'])
+
+def run_retrieval(symptoms, k, bundle, deadline=None):
+  """Returns ((normalized_symptoms, docs), shared); shared is True for a coalesced result."""
+  key = ('retrieve', bundle.tenant_id, canonical_symptoms(symptoms), k)
+  return flights.do_shared(key, lambda: rag.retrieve_for_input(symptoms, k=k, bundle=bundle), deadline=deadline)
+
+def run_full_pipeline(symptoms, bundle, deadline=None):
+  """Returns ((answer, docs, normalized_symptoms), shared); shared is True for a coalesced result."""
+  def compute():
+    (normalized_symptoms, docs), _ = run_retrieval(symptoms, config.retrieval_k, bundle, deadline)
+    answer = rag.generate_answer(normalized_symptoms, docs)
+    return answer, docs, normalized_symptoms
+
+  key = ('full', bundle.tenant_id, canonical_symptoms(symptoms))
+  return flights.do_shared(key, compute, deadline=deadline)
+
+# Append-only triage event log, written off the request path in batches
+triage_log = create_triage_log()
+
+def log_triage(mode, symptoms, bundle, normalized_symptoms, docs, should_skip_questions, coalesced=False, final=None):
+  """Enqueues a triage event with per-stage latencies from the current trace. Never blocks."""
+  if triage_log is None:
+    return
+  trace = tracer.current()
+  triage_log.record(
+    tenant=bundle.tenant_id,
+    mode=mode,
+    input_text=symptoms,
+    normalized_symptoms=normalized_symptoms,
+    docs=docs,
+    should_skip_questions=should_skip_questions,
+    stage_latency_ms=trace.stage_durations_ms() if trace else {},
+    total_latency_ms=trace.elapsed_ms() if trace else None,
+    coalesced=coalesced,
+    final=final,
+  )
+
+def assess_confidence(docs):
+  """True when the top doc clears the confidence threshold and every other doc stays below it."""
+  should_skip_questions = False
+  if docs and len(docs) > 0:
+    top_score = docs[0].get('final_score', 0)
+    other_scores = [doc.get('final_score', 0) for doc in docs[1:]]
+    
+    # Log top 3 scores for debugging
+    top_3_info = [(doc.get('Disease', 'Unknown'), doc.get('final_score', 0)) for doc in docs[:3]]
+    print(f"📊 Top 3 Scores: {', '.join([f'{disease}: {score:.3f}' for disease, score in top_3_info])}")
+    
+    # If top score > threshold AND all others < threshold, we have high confidence
+    threshold = config.confidence_threshold
+    if rag.is_high_confidence(docs, threshold):
+      should_skip_questions = True
+      print(f"🎯 High confidence decision: top={top_score:.3f}, all others < {threshold}, skipping questions")
+    else:
+      others_above_threshold = [score for score in other_scores if score >= threshold]
+      print(f"❓ Low confidence: top={top_score:.3f}, {len(others_above_threshold)} other(s) >= {threshold}, will ask questions")
+  return should_skip_questions
+
+def shed_response(shed, symptoms, bundle, final=None):
+  """
+  Answer for a request the admission controller refused. If enabled, falls back to
+  retrieval on the raw text (encode + search only, no LLM); otherwise 503.
+  """
+  print(f"🚦 Shedding request: {shed}")
+  retry_after = str(int(admission.expected_llm_seconds(2)) + 1)
+  if not admission_settings['degrade_on_shed']:
+    return jsonify({'error': 'server overloaded', 'reason': shed.reason}), 503, {'Retry-After': retry_after}
+
+  try:
+    docs = rag.retrieve_relevant_context(symptoms, k=config.retrieval_k, bundle=bundle)
+  except Exception as e:
+    print(f"Degraded retrieval failed: {e}")
+    return jsonify({'error': 'server overloaded', 'reason': shed.reason}), 503, {'Retry-After': retry_after}
+
+  normalized_symptoms = sorted(rag.extract_symptoms_from_text(symptoms))
+  should_skip_questions = assess_confidence(docs)
+  log_triage('degraded', symptoms, bundle, normalized_symptoms, docs, should_skip_questions, final=final)
+  return jsonify({
+    'answer': None,
+    'retrieved_docs': docs,
+    'normalized_symptoms': normalized_symptoms,
+    'should_skip_questions': should_skip_questions,
+    'degraded': True,
+    'shed_reason': shed.reason
+  })
+
+def check_admin_token():
+  """Returns an error response when ADMIN_TOKEN is set and the request does not carry it."""
+  token = config.get_admin_token()
+  if token and request.headers.get('X-Admin-Token') != token:
+    return jsonify({'error': 'forbidden'}), 403
+  return None
 
 @app.route('/health', methods=['GET'])
 def health():
+  """Liveness: the process is up and serving HTTP, even while models load."""
   return jsonify({'status': 'ok'})
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+  """Readiness: models loaded and warmed up; route traffic here only once this returns 200."""
+  status = 200 if startup['ready'] else 503
+  return jsonify({'status': 'ready' if startup['ready'] else 'loading', **startup}), status
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+  return jsonify({
+    'pid': os.getpid(),
+    'memory': process_memory(),
+    'startup': startup,
+    'coalescing': flights.stats(),
+    'admission': admission.stats(),
+    'triage_log': triage_log.stats() if triage_log else None,
+  })
+
+
+@app.route('/api/admin/traces', methods=['GET'])
+def admin_traces():
+  """Recent request traces from the ring buffer. ?format=chrome for chrome://tracing / Perfetto."""
+  denied = check_admin_token()
+  if denied:
+    return denied
+  limit = request.args.get('limit', type=int)
+  if request.args.get('format') == 'chrome':
+    return Response(
+      json.dumps(tracer.export_chrome(limit)), mimetype='application/json',
+      headers={'Content-Disposition': 'attachment; filename=traces.json'}
+    )
+  return jsonify(tracer.export_json(limit))
+
+
+@app.route('/api/admin/profile', methods=['GET'])
+def admin_profile():
+  """Samples all request threads for ?seconds=N and returns folded stacks for flamegraph tools."""
+  denied = check_admin_token()
+  if denied:
+    return denied
+  seconds = min(request.args.get('seconds', default=10, type=float), config.tracing['profile_max_seconds'])
+  interval = request.args.get('interval_ms', default=10, type=float) / 1000
+  try:
+    counts = sample_stacks(seconds, interval=max(interval, 0.001))
+  except RuntimeError as e:
+    return jsonify({'error': str(e)}), 409
+  return Response(to_folded(counts), mimetype='text/plain')
+
+
+@app.route('/api/tenants/metrics', methods=['GET'])
+def tenant_metrics():
+  return jsonify(tenants.metrics())
+
+
+def analytics_range():
+  """(start, end, tenant) from query args; start/end accept epoch seconds or ISO dates, default last 7 days."""
+  now = time.time()
+  start = parse_time(request.args.get('start'), now - 7 * 24 * 3600)
+  end = parse_time(request.args.get('end'), now)
+  return start, end, request.args.get('tenant')
+
+
+@app.route('/api/analytics/departments', methods=['GET'])
+def analytics_departments():
+  denied = check_admin_token()
+  if denied:
+    return denied
+  if triage_log is None:
+    return jsonify({'error': 'triage log disabled'}), 404
+  try:
+    start, end, tenant = analytics_range()
+  except ValueError as e:
+    return jsonify({'error': 'invalid time range', 'detail': str(e)}), 400
+  return jsonify({'start': start, 'end': end, 'departments': triage_log.department_volumes(start, end, tenant)})
+
+
+@app.route('/api/analytics/symptoms', methods=['GET'])
+def analytics_symptoms():
+  denied = check_admin_token()
+  if denied:
+    return denied
+  if triage_log is None:
+    return jsonify({'error': 'triage log disabled'}), 404
+  try:
+    start, end, tenant = analytics_range()
+  except ValueError as e:
+    return jsonify({'error': 'invalid time range', 'detail': str(e)}), 400
+  limit = request.args.get('limit', default=20, type=int)
+  return jsonify({'start': start, 'end': end, 'combinations': triage_log.top_symptom_combinations(start, end, tenant, limit)})
+
+
+@app.route('/api/analytics/events', methods=['GET'])
+def analytics_events():
+  """Recent events. Raw complaint text only with ?include_text=1, which requires ADMIN_TOKEN to be set."""
+  denied = check_admin_token()
+  if denied:
+    return denied
+  if triage_log is None:
+    return jsonify({'error': 'triage log disabled'}), 404
+  include_text = request.args.get('include_text', '').lower() in ('1', 'true')
+  if include_text and not config.get_admin_token():
+    return jsonify({'error': 'include_text requires ADMIN_TOKEN to be configured'}), 403
+  try:
+    start, end, tenant = analytics_range()
+  except ValueError as e:
+    return jsonify({'error': 'invalid time range', 'detail': str(e)}), 400
+  limit = request.args.get('limit', default=100, type=int)
+  events = triage_log.recent_events(start, end, tenant, limit, include_text=include_text)
+  return jsonify({'start': start, 'end': end, 'events': events})
+
+
 @app.route('/api/ask', methods=['POST'])
 def api_ask():
   print("api_ask called")
   """JSON API: accepts {'symptoms': '...', 'skip_llm': false} and returns JSON with 'answer' and 'retrieved_docs'.
-  If skip_llm is true, only does RAG retrieval without calling LLM."""
+  If skip_llm is true, only does RAG retrieval without calling LLM.
+  The hospital site is selected with the X-Tenant-ID header (or a 'tenant' field).
+  X-Priority ('intake' or 'doctor') and X-Request-Timeout drive admission control.
+  An optional 'final' flag marks the request that decides the triage, for analytics."""
   data = request.get_json(force=True, silent=True) or {}
   symptoms = (data.get('symptoms') or '').strip()
   skip_llm = data.get('skip_llm', False)
+  # Client marks the request that decides the triage (analytics count those)
+  final = None if data.get('final') is None else bool(data.get('final'))
   if not symptoms:
     return jsonify({'error': 'symptoms required'}), 400
+  if not startup['ready']:
+    return not_ready_response()
+
+  try:
+    bundle = resolve_tenant(data)
+  except KeyError as e:
+    return jsonify({'error': 'unknown tenant', 'detail': str(e)}), 404
+
+  # Unlabelled traffic gets the lowest class, so omitting the header never beats declaring one
+  priority = request.headers.get('X-Priority') or data.get('priority') or admission_settings['priorities'][-1]
+  deadline = request_deadline(data)
+  with tracer.trace('/api/ask', skip_llm=bool(skip_llm), tenant=bundle.tenant_id, priority=priority):
+    try:
+      with tracer.span('admission'):
+        admission.acquire(priority, deadline, llm_calls=1 if skip_llm else 2)
+    except RequestShed as shed:
+      return shed_response(shed, symptoms, bundle, final)
 
+    try:
+      return answer_request(symptoms, skip_llm, bundle, deadline, final)
+    except FlightTimeout:
+      # Waited on a coalesced call past the deadline; answer like a shed request
+      return shed_response(RequestShed('deadline', priority), symptoms, bundle, final)
+    finally:
+      admission.release()
+
+
+def answer_request(symptoms, skip_llm, bundle, deadline=None, final=None):
+  """
+  Runs the RAG pipeline for an admitted request and builds the JSON response.
+  Raises FlightTimeout if a coalesced call it waits on outlives `deadline`.
+  """
   # Retrieve context
   try:
     if skip_llm:
       # Only do RAG retrieval, skip LLM
       print("Skipping LLM, only doing RAG retrieval")
-      normalized_symptoms = rag.extract_symptoms_via_llm(symptoms)
-      normalized_query = ", ".join(normalized_symptoms)
-      docs = rag.retrieve_relevant_context(normalized_query, k=5)
+      (normalized_symptoms, docs), coalesced = run_retrieval(symptoms, config.retrieval_k, bundle, deadline)
       
       # Check score confidence even in skip_llm mode
-      should_skip_questions = False
-      if docs and len(docs) > 0:
-        top_score = docs[0].get('final_score', 0)
-        other_scores = [doc.get('final_score', 0) for doc in docs[1:]]
-        
-        # Log top 3 scores for debugging
-        top_3_info = [(doc.get('Disease', 'Unknown'), doc.get('final_score', 0)) for doc in docs[:3]]
-        print(f"📊 Top 3 Scores: {', '.join([f'{disease}: {score:.3f}' for disease, score in top_3_info])}")
-        
-        # If top score > 0.7 AND all others < 0.7, we have high confidence
-        if top_score > 0.7 and all(score < 0.7 for score in other_scores):
-          should_skip_questions = True
-          print(f"🎯 High confidence decision: top={top_score:.3f}, all others < 0.7, skipping questions")
-        else:
-          others_above_threshold = [score for score in other_scores if score >= 0.7]
-          print(f"❓ Low confidence: top={top_score:.3f}, {len(others_above_threshold)} other(s) >= 0.7, will ask questions")
+      should_skip_questions = assess_confidence(docs)
+      log_triage('skip_llm', symptoms, bundle, normalized_symptoms, docs, should_skip_questions, coalesced, final)
       
       return jsonify({
         'retrieved_docs': docs,
@@ -65,7 +403,7 @@ def api_ask():
       })
     else:
       # Full pipeline with LLM
-      answer, docs, normalized_symptoms = rag.ask_gpt4(symptoms)
+      (answer, docs, normalized_symptoms), coalesced = run_full_pipeline(symptoms, bundle, deadline)
       print("="*20)
       print(f"Answer: {answer}")
       print(f"Docs: {docs}")
@@ -80,22 +418,8 @@ def api_ask():
           parsed = None
 
       # Check score confidence to decide if we should ask more questions
-      should_skip_questions = False
-      if docs and len(docs) > 0:
-        top_score = docs[0].get('final_score', 0)
-        other_scores = [doc.get('final_score', 0) for doc in docs[1:]]
-        
-        # Log top 3 scores for debugging
-        top_3_info = [(doc.get('Disease', 'Unknown'), doc.get('final_score', 0)) for doc in docs[:3]]
-        print(f"📊 Top 3 Scores: {', '.join([f'{disease}: {score:.3f}' for disease, score in top_3_info])}")
-        
-        # If top score > 0.7 AND all others < 0.7, we have high confidence
-        if top_score > 0.7 and all(score < 0.7 for score in other_scores):
-          should_skip_questions = True
-          print(f"🎯 High confidence decision: top={top_score:.3f}, all others < 0.7, skipping questions")
-        else:
-          others_above_threshold = [score for score in other_scores if score >= 0.7]
-          print(f"❓ Low confidence: top={top_score:.3f}, {len(others_above_threshold)} other(s) >= 0.7, will ask questions")
+      should_skip_questions = assess_confidence(docs)
+      log_triage('full', symptoms, bundle, normalized_symptoms, docs, should_skip_questions, coalesced, final)
       
       # Modify parsed response to include skip_questions flag
       if parsed and isinstance(parsed, dict):
@@ -110,10 +434,17 @@ def api_ask():
         'normalized_symptoms': normalized_symptoms,
         'should_skip_questions': should_skip_questions
       })
+  except FlightTimeout:
+    raise
   except Exception as e:
     print(f"Error in RAG processing: {e}")
     traceback.print_exc()
     return jsonify({'error': 'RAG processing failed', 'detail': str(e), 'traceback': traceback.format_exc()}), 500
 
+# Under the prefork launcher (serve.py) threads must not exist before fork();
+# each worker calls start_background_work() itself.
+if os.environ.get('RAG_PREFORK') != '1':
+  start_background_work()
+
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=5000, debug=True)
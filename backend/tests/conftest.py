@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# backend/src modules import each other flat (e.g. `from config_loader import config`)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
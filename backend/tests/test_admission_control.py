@@ -0,0 +1,84 @@
+import pytest
+
+from admission_control import AdmissionController, RequestShed
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_controller(clock, **kwargs):
+    return AdmissionController(["intake", "doctor"], {"intake": 8, "doctor": 8}, target_latency=4.0,
+                               clock=clock, **kwargs)
+
+
+def admitted(controller, clock, budget, llm_calls=1):
+    try:
+        controller.acquire("intake", clock() + budget, llm_calls=llm_calls)
+    except RequestShed:
+        return False
+    controller.release()
+    return True
+
+
+def test_single_slow_call_does_not_shed_everything(clock):
+    controller = make_controller(clock)
+    controller.observe_llm_latency(35)
+
+    results = [admitted(controller, clock, 30) for _ in range(100)]
+
+    assert all(results)
+    assert controller.stats()["llm_latency_ewma"] <= controller.max_latency_sample
+
+
+def test_shedding_recovers_without_new_samples(clock):
+    controller = make_controller(clock)
+    for _ in range(50):
+        controller.observe_llm_latency(35)
+    assert not admitted(controller, clock, 10)
+
+    # Nothing is admitted, so no new samples arrive; the estimate must still decay
+    clock.now += 5 * controller.decay_half_life
+
+    assert admitted(controller, clock, 10)
+
+
+def test_failed_calls_shrink_the_limit(clock):
+    controller = make_controller(clock, initial_limit=8)
+    for _ in range(5):
+        controller.observe_llm_latency(0.5, failed=True)
+
+    assert controller.limit < 8
+
+
+def test_unknown_priority_uses_lowest_class(clock):
+    controller = make_controller(clock)
+    controller.acquire("unknown", clock() + 30)
+
+    assert controller.stats()["admitted"] == {"intake": 0, "doctor": 1}
+
+
+def test_failed_wait_frees_queue_and_slot(clock):
+    controller = make_controller(clock, initial_limit=1, max_limit=1)
+    controller.acquire("intake", clock() + 30)  # Holds the only slot
+
+    # A waiter that dies in wait() (e.g. OverflowError) must not leave its entry behind
+    def broken_wait(timeout=None):
+        raise OverflowError("timeout value is too large")
+    controller._cond.wait = broken_wait
+    with pytest.raises(OverflowError):
+        controller.acquire("intake", clock() + 30)
+
+    assert controller.stats()["queue_depth"]["intake"] == 0
+    controller.release()
+    assert controller.stats()["in_flight"] == 0
+    assert admitted(controller, clock, 30)
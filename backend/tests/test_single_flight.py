@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import FlightTimeout, SingleFlight
+
+
+def wait_for(predicate, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < end, "condition not reached"
+        time.sleep(0.005)
+
+
+def start_followers(flights, key, count, deadline=None):
+    """Starts `count` threads calling flights.do(key) and waits until all have joined the leader."""
+    outcomes = []
+    lock = threading.Lock()
+    joined = flights.stats()["coalesced"]
+
+    def follow():
+        try:
+            outcome = ("result", flights.do(key, lambda: "follower ran", deadline=deadline))
+        except BaseException as e:
+            outcome = ("error", e)
+        with lock:
+            outcomes.append(outcome)
+
+    threads = [threading.Thread(target=follow) for _ in range(count)]
+    for t in threads:
+        t.start()
+    wait_for(lambda: flights.stats()["coalesced"] == joined + count)
+    return threads, outcomes
+
+
+def run_leader(flights, key, fn):
+    """Starts the leader in a thread and waits until its call is in flight."""
+    outcome = {}
+
+    def lead():
+        try:
+            outcome["result"] = flights.do(key, fn)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    wait_for(lambda: flights.stats()["in_flight"] == 1)
+    return thread, outcome
+
+
+def test_concurrent_callers_share_one_execution():
+    flights = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        release.wait()
+        return "answer"
+
+    leader, outcome = run_leader(flights, "k", compute)
+    followers, outcomes = start_followers(flights, "k", 5)
+    release.set()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert runs == [1]
+    assert outcome == {"result": "answer"}
+    assert outcomes == [("result", "answer")] * 5
+    assert flights.stats() == {"executed": 1, "coalesced": 5, "wait_timeouts": 0, "in_flight": 0}
+
+
+def test_error_reaches_followers_but_is_not_kept():
+    flights = SingleFlight(linger_seconds=60)
+    release = threading.Event()
+
+    def fail():
+        release.wait()
+        raise ValueError("boom")
+
+    leader, outcome = run_leader(flights, "k", fail)
+    followers, outcomes = start_followers(flights, "k", 3)
+    release.set()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert isinstance(outcome["error"], ValueError)
+    assert [kind for kind, _ in outcomes] == ["error"] * 3
+    assert all(isinstance(e, ValueError) for _, e in outcomes)
+    # Even with a linger window, the next caller runs the function again
+    assert flights.do("k", lambda: "fresh") == "fresh"
+
+
+def test_interrupted_leader_is_not_cached():
+    flights = SingleFlight(linger_seconds=60)
+    release = threading.Event()
+
+    def interrupted():
+        release.wait()
+        raise KeyboardInterrupt
+
+    leader, outcome = run_leader(flights, "k", interrupted)
+    followers, outcomes = start_followers(flights, "k", 2)
+    release.set()
+    for t in [leader, *followers]:
+        t.join()
+
+    assert isinstance(outcome["error"], KeyboardInterrupt)
+    # Followers get a plain failure, never a None result
+    assert [kind for kind, _ in outcomes] == ["error"] * 2
+    assert all(isinstance(e, RuntimeError) for _, e in outcomes)
+    assert flights.do("k", lambda: "fresh") == "fresh"
+
+
+def test_follower_times_out_at_its_deadline():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    leader, outcome = run_leader(flights, "k", lambda: release.wait() and "slow")
+    with pytest.raises(FlightTimeout):
+        flights.do("k", lambda: "follower ran", deadline=time.monotonic() + 0.05)
+    assert flights.stats()["wait_timeouts"] == 1
+
+    # The leader is unaffected and still completes
+    release.set()
+    leader.join()
+    assert outcome == {"result": "slow"}
@@ -0,0 +1,45 @@
+import time
+
+from triage_log import TriageLog
+
+DOCS = [{"Disease": "Migren", "Department": "Nöroloji", "final_score": 0.8}]
+
+
+def record(log, mode, **kwargs):
+    log.record("default", mode, "başım ağrıyor", ["baş ağrısı"], DOCS, False, {}, **kwargs)
+
+
+def test_one_patient_counts_once(tmp_path):
+    log = TriageLog(tmp_path / "triage.sqlite3", flush_interval=60)
+    log.start()
+    record(log, "full", final=False)
+    for _ in range(3):
+        record(log, "skip_llm", final=False)
+    record(log, "full", coalesced=True, final=True)
+    log.stop()  # Must write everything still queued, well before flush_interval
+
+    assert log.stats()["written"] == 5
+    volumes = log.department_volumes(0, time.time() + 1)
+    assert [(v["department"], v["count"]) for v in volumes] == [("Nöroloji", 1)]
+
+
+def test_unflagged_clients_count_uncoalesced_full_runs(tmp_path):
+    log = TriageLog(tmp_path / "triage.sqlite3")
+    log.start()
+    record(log, "full")
+    record(log, "full", coalesced=True)
+    record(log, "skip_llm")
+    log.stop()
+
+    combinations = log.top_symptom_combinations(0, time.time() + 1)
+    assert combinations == [{"symptoms": "baş ağrısı", "count": 1}]
+
+
+def test_events_omit_input_text_by_default(tmp_path):
+    log = TriageLog(tmp_path / "triage.sqlite3")
+    log.start()
+    record(log, "full")
+    log.stop()
+
+    assert "input_text" not in log.recent_events(0, time.time() + 1)[0]
+    assert log.recent_events(0, time.time() + 1, include_text=True)[0]["input_text"] == "başım ağrıyor"
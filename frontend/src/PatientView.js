@@ -2,6 +2,9 @@ import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import Logo from './assets/logo.svg';
 
+// Patient intake is the highest admission class on the backend (see config.yaml)
+const INTAKE_REQUEST = { headers: { 'X-Priority': 'intake' } };
+
 function PatientView({ onNavigateToDepartment }) {
   // Helper function to normalize symptoms for comparison
   const normalizeSymptom = (symptom) => {
@@ -42,7 +45,8 @@ function PatientView({ onNavigateToDepartment }) {
 
   const getDoctorInfo = async (symptomsText) => {
     try {
-      const res = await axios.post('/api/ask', { symptoms: symptomsText });
+      // final: this request decides the department, so the triage log counts it once
+      const res = await axios.post('/api/ask', { symptoms: symptomsText, final: true }, INTAKE_REQUEST);
       const answer = res.data.answer;
       
       console.log('LLM Raw Response:', answer);
@@ -90,7 +94,7 @@ function PatientView({ onNavigateToDepartment }) {
     setLoading(true);
     setError(null);
     try {
-      const res = await axios.post('/api/ask', { symptoms: symptomsText });
+      const res = await axios.post('/api/ask', { symptoms: symptomsText, final: false }, INTAKE_REQUEST);
       console.log('API response:', res.data);
       
       const docs = res.data.retrieved_docs || [];
@@ -110,9 +114,9 @@ function PatientView({ onNavigateToDepartment }) {
         return;
       }
 
-      // Check if backend says we should skip questions (high confidence)
-      // OR if the first doc has final_score > 0.7 and others are < 0.7
-      if (shouldSkipQuestions || (docs.length > 0 && docs[0].final_score > 0.7 && docs.slice(1).every(d => d.final_score < 0.7))) {
+      // Check if backend says we should skip questions (high confidence).
+      // The threshold lives in the backend config (confidence_threshold).
+      if (shouldSkipQuestions && docs.length > 0) {
         // Navigate to department with doctor info
         const normalizedText = normalized.join(', ');
         const doctorInfo = await getDoctorInfo(symptomsText);
@@ -214,20 +218,18 @@ function PatientView({ onNavigateToDepartment }) {
         // Only call RAG to check scores, skip LLM
         const res = await axios.post('/api/ask', { 
           symptoms: newSymptoms,
-          skip_llm: true 
-        });
+          skip_llm: true,
+          final: false
+        }, INTAKE_REQUEST);
         
         const docs = res.data.retrieved_docs || [];
         const normalized = res.data.normalized_symptoms || [];
         setRetrievedDocs(docs);
         setNormalizedSymptomsList(normalized);
         
-        // Check if we now have a confident match
+        // Check if we now have a confident match (decided by the backend)
         if (docs.length > 0) {
-          const topScore = docs[0].final_score;
-          const othersLow = docs.slice(1).every(d => d.final_score < 0.7);
-          
-          if (topScore > 0.7 && othersLow) {
+          if (res.data.should_skip_questions) {
             // Navigate to department with doctor info
             const normalizedText = normalized.join(', ');
             setSurveyMode(false); // Hide survey only when navigating
@@ -0,0 +1,79 @@
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Load-tests a running backend (web_app.py or serve.py) and reports throughput.
+# Run it once per worker count to measure scaling, e.g.:
+#   RAG_LLM_STUB_SECONDS=0 python backend/src/serve.py --workers 4 &
+#   python helpers/bench_throughput.py --requests 400 --concurrency 32
+# --mode retrieval (default) sends skip_llm requests: symptom extraction +
+# encode + FAISS search through the normal admission and coalescing path.
+# With RAG_LLM_STUB_SECONDS set on the server, extraction is a canned
+# response, so the benchmark measures the CPU-bound part that worker count
+# scales, with no OpenAI calls. --mode full adds the completion call.
+# Payloads are unique per request so coalescing does not hide the work;
+# pass --repeat-payloads to measure a coalescing-friendly load instead.
+
+SAMPLE_SYMPTOMS = [
+    "baş ağrısı, bulantı, ışığa duyarlılık",
+    "öksürük, ateş, nefes darlığı",
+    "kaşıntı, deri döküntüsü",
+    "karın ağrısı, ishal, kusma",
+    "göğüs ağrısı, çarpıntı, terleme",
+    "eklem ağrısı, şişlik, sabah tutukluğu",
+]
+
+
+def post(url, payload, headers):
+    body = json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json", **headers})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            body = json.loads(resp.read() or b"{}")
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        body = {}
+        status = e.code
+    return status, time.perf_counter() - start, bool(body.get("degraded"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark for /api/ask")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/api/ask")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mode", choices=["retrieval", "full"], default="retrieval",
+                        help="retrieval: skip_llm requests; full: also the completion call")
+    parser.add_argument("--repeat-payloads", action="store_true",
+                        help="Cycle through a few symptom sets (lets coalescing share work)")
+    args = parser.parse_args()
+
+    headers = {"X-Priority": "intake"}
+    payloads = []
+    for i in range(args.requests):
+        symptoms = SAMPLE_SYMPTOMS[i % len(SAMPLE_SYMPTOMS)]
+        if not args.repeat_payloads:
+            symptoms += f", belirti {i}"  # Unique text, so every request is computed
+        payloads.append({"symptoms": symptoms, "skip_llm": args.mode == "retrieval", "final": False})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda p: post(args.url, p, headers), payloads))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(r[1] for r in results)
+    ok = sum(1 for r in results if r[0] == 200)
+    degraded = sum(1 for r in results if r[2])
+    print(f"Requests: {len(results)} ({ok} OK, {degraded} degraded/shed) in {elapsed:.2f}s")
+    print(f"Throughput: {len(results) / elapsed:.1f} req/s")
+    print(f"Latency p50: {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()